@@ -0,0 +1,113 @@
+# bench/benchmark.py — tempos do pipeline de dados em CSVs sintéticos, comparados com a baseline salva.
+#
+#   python bench/benchmark.py                              # 10 mil e 100 mil linhas, compara com bench/baseline.json
+#   python bench/benchmark.py --linhas 1000000 --repeticoes 1
+#   python bench/benchmark.py --salvar                     # grava os tempos atuais como nova baseline
+#
+# Cada etapa vale o melhor de N repetições (mais, nas etapas rápidas). Sai com código 1 se alguma etapa ficar mais lenta
+# que baseline × tolerância (e mais de --folga-ms acima dela) (a baseline é da máquina em que foi gravada — regrave ao trocar de máquina).
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from nucleo import (  # noqa: E402
+    ler_csv_robusto, processar_df_base, otimizar_tipos, ordenar_por_data, faixa_datas,
+    filter_df_by_period, compute_kpis_por_responsavel, kpi_do_tecnico,
+)
+from bench.gerar_chats import gerar_csv, responsaveis  # noqa: E402
+
+DIR_DADOS = os.path.join(RAIZ, "bench", "dados")
+BASELINE = os.path.join(RAIZ, "bench", "baseline.json")
+ETAPAS = ("ler_csv_robusto", "processar_df_base", "filter_df_by_period",
+          "compute_kpis_por_responsavel", "kpi_do_tecnico")
+
+def medir(fn, repeticoes: int, orcamento_s: float = 0.3) -> float:
+    # melhor de pelo menos N execuções; etapas rápidas repetem até somar ~orcamento_s (ruído de ms)
+    melhor, gasto, feitas = float("inf"), 0.0, 0
+    while feitas < repeticoes or gasto < orcamento_s:
+        t0 = time.perf_counter(); fn(); dt = time.perf_counter() - t0
+        melhor, gasto, feitas = min(melhor, dt), gasto + dt, feitas + 1
+    return melhor
+
+def dataset(linhas: int, seed: int) -> str:
+    caminho = os.path.join(DIR_DADOS, f"chats_{linhas}_{seed}.csv")
+    if not os.path.exists(caminho): gerar_csv(caminho, linhas, seed)
+    return caminho
+
+def tecnicos_de_teste() -> list:
+    # vínculos como no cadastro real: nome exato, usuário de e-mail, apelido, erro de digitação, sem par
+    resp = responsaveis()
+    tec = [{"name": r, "username": r.lower()} for r in resp[:8]]
+    tec += [{"name": r.split(" (")[0], "username": r.split("(")[-1].rstrip(")")} for r in resp[8:20] if "(" in r]
+    tec += [{"name": r[:-3] + "x" + r[-2:], "username": "u"} for r in resp[20:26]]
+    tec += [{"name": f"Sem Vínculo {i}", "username": f"nv{i}"} for i in range(4)]
+    return tec
+
+def rodar(linhas: int, seed: int, repeticoes: int) -> dict:
+    with open(dataset(linhas, seed), "rb") as f: conteudo = f.read()
+    res = {"ler_csv_robusto": medir(lambda: ler_csv_robusto(conteudo), repeticoes)}
+    bruto = ler_csv_robusto(conteudo)
+    res["processar_df_base"] = medir(lambda: processar_df_base(bruto), repeticoes)
+    df, _ = ordenar_por_data(otimizar_tipos(processar_df_base(bruto)).reset_index(drop=True))
+    ini, fim = faixa_datas(df)
+    meio = ini.date() + (fim.date() - ini.date()) / 2
+    per = (meio, meio + timedelta(days=29))  # um mês no meio da série
+    res["filter_df_by_period"] = medir(lambda: filter_df_by_period(df, *per), repeticoes)
+    df_mes = filter_df_by_period(df, *per)
+    res["compute_kpis_por_responsavel"] = medir(lambda: compute_kpis_por_responsavel(df_mes), repeticoes)
+    kpis_norm, _ = compute_kpis_por_responsavel(df_mes)
+    tecnicos = tecnicos_de_teste()
+    res["kpi_do_tecnico"] = medir(lambda: [kpi_do_tecnico(t, kpis_norm) for t in tecnicos], repeticoes)
+    res["_linhas_processadas"] = len(df)
+    return res
+
+def comparar(atual: dict, base: dict, tolerancia: float, folga_ms: float = 1.0) -> bool:
+    ok = True
+    for linhas, tempos in atual.items():
+        ref = base.get("resultados", {}).get(linhas, {})
+        print(f"\n{int(linhas):,} linhas".replace(",", "."))
+        print(f"  {'etapa':<30}{'atual':>10}{'baseline':>10}{'razão':>8}")
+        for etapa in ETAPAS:
+            t, b = tempos[etapa], ref.get(etapa)
+            razao = t / b if b else None
+            lento = razao is not None and razao > tolerancia and (t - b) * 1000 > folga_ms  # etapas de µs oscilam muito
+            ok = ok and not lento
+            print(f"  {etapa:<30}{t*1000:>8.1f}ms" + (f"{b*1000:>8.1f}ms{razao:>8.2f}" if b else f"{'—':>10}{'':>8}")
+                  + ("  ← REGRESSÃO" if lento else ""))
+    return ok
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark do pipeline de dados com baseline.")
+    ap.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--tolerancia", type=float, default=1.5, help="razão atual/baseline a partir da qual acusa regressão")
+    ap.add_argument("--folga-ms", type=float, default=1.0, help="diferença absoluta mínima para contar como regressão")
+    ap.add_argument("--salvar", action="store_true", help="grava os resultados como baseline")
+    args = ap.parse_args(argv)
+
+    atual = {str(n): rodar(n, args.seed, args.repeticoes) for n in args.linhas}
+    base = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f: base = json.load(f)
+    ok = comparar(atual, base, args.tolerancia, args.folga_ms)
+    if args.salvar:
+        base = {"meta": {"data": date.today().isoformat(), "python": platform.python_version(),
+                         "pandas": pd.__version__, "maquina": platform.platform(), "seed": args.seed,
+                         "repeticoes": args.repeticoes},
+                "resultados": {**base.get("resultados", {}), **atual}}
+        with open(BASELINE, "w", encoding="utf-8") as f: json.dump(base, f, indent=2, ensure_ascii=False)
+        print(f"\nbaseline gravada em {BASELINE}")
+        return 0
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+# bench/conferencia.py — confere que cubo, sketches e KPIs por responsável enxergam os mesmos rótulos.
+#
+#   python bench/conferencia.py          # sai com código 1 se alguma conferência falhar
+#
+# Rótulos com espaços nas pontas ("Ana " e "Ana", ou só "Caio ") têm de virar uma pessoa só no cubo (deltas da ficha,
+# contagens) e nos sketches (percentis, linhas p50/p90/p95 de Tendências), como já acontece nas KPIs.
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from nucleo import (  # noqa: E402
+    compute_kpis_por_responsavel, construir_cubo, construir_sketches, contagens_cubo, resumo_cubo,
+    serie_cubo, serie_quantis_sketch, quantis_sketch,
+)
+
+def base_com_rotulos_sujos() -> pd.DataFrame:
+    resp = ["Ana"] * 10 + ["Ana "] * 5 + [" Bia", "Bia", "Caio ", "Caio ", " ", None]
+    n = len(resp)
+    return pd.DataFrame({
+        "responsible": resp,
+        "rating": [5.0] * 10 + [1.0] * 5 + [4.0, 2.0, 3.0, 5.0, 3.0, 3.0],
+        "duracao_minutos": np.linspace(1, 20, n),
+        "tempo_espera_segundos": np.linspace(10, 200, n),
+        "created_dt": pd.date_range("2024-01-01", periods=n, freq="12h"),
+    })
+
+def conferir() -> list:
+    falhas = []
+    def _checa(cond, msg):
+        if not cond: falhas.append(msg)
+    df = base_com_rotulos_sujos()
+    cubo, sk = construir_cubo(df), construir_sketches(df)
+
+    res = resumo_cubo(cubo, "responsible")
+    _checa(sorted(res.index) == ["Ana", "Bia", "Caio"], f"cubo: rótulos {list(res.index)}")
+    _checa(res.loc["Ana", "n"] == 15, f"cubo: n de Ana = {res.loc['Ana', 'n']} (esperado 15)")
+    kpis, _ = compute_kpis_por_responsavel(df)
+    rating_kpi = {k["responsavel_label"]: k["rating_media"] for k in kpis.values()}
+    _checa(np.isclose(res.loc["Ana", "rating_media"], rating_kpi.get("Ana", np.nan)),
+           f"cubo: rating de Ana {res.loc['Ana', 'rating_media']} ≠ KPI {rating_kpi.get('Ana')}")
+    _checa(int(contagens_cubo(cubo, "responsible").sum()) == 19, "cubo: contagens perderam linhas")
+
+    q = quantis_sketch(sk, "duracao_minutos", por_responsavel=True)
+    _checa(sorted(q.index) == ["Ana", "Bia", "Caio"], f"sketches: rótulos {list(q.index)}")
+    _checa(q.loc["Ana", "n"] == 15, f"sketches: n de Ana = {q.loc['Ana', 'n']} (esperado 15)")
+    _checa(quantis_sketch(sk, "duracao_minutos").loc["_total", "n"] == len(df), "sketches: total perdeu linhas")
+
+    # Tendências: o selectbox oferece os rótulos do cubo e filtra cubo e sketches com eles
+    for valor in contagens_cubo(cubo, "responsible").index:
+        d = serie_cubo(cubo, "responsible", valor)
+        _checa(d is not None and not d.empty, f"tendência: série do cubo vazia para {valor!r}")
+        for m in ("duracao_minutos", "tempo_espera_segundos"):
+            sq = serie_quantis_sketch(sk, m, (0.9,), valor)
+            _checa(sq is not None and sq.iloc[:, 0].notna().any(), f"tendência: sem p90 de {m} para {valor!r}")
+    return falhas
+
+def main() -> int:
+    falhas = conferir()
+    for f in falhas: print(f"FALHOU  {f}")
+    print("ok" if not falhas else f"{len(falhas)} conferência(s) falharam")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
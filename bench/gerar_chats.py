@@ -0,0 +1,130 @@
+# bench/gerar_chats.py — gerador determinístico de chats_resume sintético (10 mil a 10 milhões de linhas).
+# Mesmas colunas do export real, durações HH:MM:SS, created_at com fuso, responsáveis/clientes
+# com distribuição enviesada (Zipf) e uma fração de linhas malformadas.
+#
+#   python bench/gerar_chats.py --linhas 1000000 --saida bench/dados/chats_1m.csv
+import argparse
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nucleo import COLUNAS_NECESSARIAS  # noqa: E402
+
+BLOCO_LINHAS = 250_000
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+         "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sabrina", "Tiago", "Vanessa", "William"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Costa", "Ferreira", "Almeida", "Ribeiro"]
+GRUPOS = np.array(["Suporte N1", "Suporte N2", "Infraestrutura", "Treinamento"])
+GRUPOS_P = np.array([0.55, 0.25, 0.15, 0.05])
+SERVICOS = np.array(["AtendSaúde", "AtendeEndemias", "PEC", "eSUS Feedback", "Infra", "Meeds",
+                     "Sistema Hospital", "VISA", "AB Território", "Outros"])
+ITENS_POR_SERVICO = 12
+
+def responsaveis(n: int = 60) -> np.ndarray:
+    # rótulos no formato do export: "Nome Sobrenome", às vezes com e-mail ou apelido entre parênteses
+    rng = np.random.default_rng(7)
+    res = []
+    for i in range(n):
+        nome, sob = NOMES[i % len(NOMES)], SOBRENOMES[(i // len(NOMES) + i) % len(SOBRENOMES)]
+        tipo = rng.integers(0, 4)
+        if tipo == 0: res.append(f"{nome.lower()}.{sob.lower()}{i}@novetech.com.br")
+        elif tipo == 1: res.append(f"{nome} {sob} ({nome.lower()}{i})")
+        else: res.append(f"{nome} {sob} {i}")
+    return np.array(res)
+
+def _zipf(rng, a: float, n: int, k: int) -> np.ndarray:
+    # índices 0..k-1 com cauda longa (Zipf truncada por rejeição simples)
+    idx = rng.zipf(a, n) - 1
+    fora = idx >= k
+    idx[fora] = rng.integers(0, k, fora.sum())
+    return idx
+
+def _hms(seg: np.ndarray) -> pd.Series:
+    seg = seg.astype("int64")
+    h, m, s = (pd.Series(x).astype(str).str.zfill(2) for x in (seg // 3600, seg % 3600 // 60, seg % 60))
+    return h + ":" + m + ":" + s
+
+def gerar_bloco(linhas: int, seed: int, bloco: int, inicio_id: int, dias: int = 730,
+                inicio: str = "2023-01-01", pct_malformadas: float = 0.002) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, bloco])
+    resp, n_cli = responsaveis(), 3000
+    servico = rng.integers(0, len(SERVICOS), linhas)
+    item = servico * ITENS_POR_SERVICO + _zipf(rng, 1.6, linhas, ITENS_POR_SERVICO)
+    # horário comercial pesa mais (turnos Manhã/Tarde), madrugada quase vazia
+    dia = rng.integers(0, dias, linhas)
+    hora = np.clip(rng.normal(13, 3.5, linhas), 0, 23.99)
+    ts = (np.datetime64(inicio) + dia.astype("timedelta64[D]")
+          + (hora * 3600).astype("int64").astype("timedelta64[s]"))
+    duracao = np.clip(rng.lognormal(np.log(15 * 60), 0.9, linhas), 20, 8 * 3600)
+    espera = np.clip(rng.lognormal(np.log(25), 1.1, linhas), 0, 3 * 3600)
+    rating = np.where(rng.random(linhas) < 0.6, np.nan, rng.choice([1, 2, 3, 4, 5], linhas, p=[.03, .03, .09, .25, .6]))
+    ids = np.arange(inicio_id, inicio_id + linhas)
+    df = pd.DataFrame({
+        "name": pd.Series(ids).astype(str).radd("Chat #"),
+        "group_attendants_name": GRUPOS[rng.choice(len(GRUPOS), linhas, p=GRUPOS_P)],
+        "client_name": pd.Series(_zipf(rng, 1.2, linhas, n_cli)).astype(str).radd("Município "),
+        "services_catalog_name": SERVICOS[servico],
+        "services_catalog_area_name": np.where(servico < 5, "Sistemas", "Infra"),
+        "services_catalog_item_name": pd.Series(item).astype(str).radd("Item "),
+        "ticket_title": pd.Series(ids % 997).astype(str).radd("Dúvida, acesso ao sistema #"),  # vírgula: exige aspas
+        "duration": _hms(duracao),
+        "waiting_time": _hms(espera),
+        "responsible": resp[_zipf(rng, 1.3, linhas, len(resp))],
+        "rating": rating,
+        "created_at": pd.Series(np.datetime_as_string(ts, unit="s")) + "-03:00",
+    })[COLUNAS_NECESSARIAS]
+    # sujeira que aparece no export real: tempos vazios/inválidos, data inválida
+    ruim = rng.random(linhas) < pct_malformadas
+    tipo = rng.integers(0, 3, linhas)
+    df.loc[ruim & (tipo == 0), "duration"] = ""
+    df.loc[ruim & (tipo == 1), "waiting_time"] = "N/A"
+    df.loc[ruim & (tipo == 2), "created_at"] = "data inválida"
+    return df
+
+def _linhas_quebradas(rng, n: int, sep: str) -> list:
+    # colunas a mais (separador sem aspas) — o leitor descarta e conta essas linhas
+    campos = len(COLUNAS_NECESSARIAS) + 3
+    return [sep.join(["quebrada"] * campos) for _ in range(n)]
+
+def gerar_csv(caminho: str, linhas: int, seed: int = 42, sep: str = ",", pct_malformadas: float = 0.002,
+              progresso: Optional[callable] = None) -> str:
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(sep.join(COLUNAS_NECESSARIAS) + "\n")
+        for b, ini in enumerate(range(0, linhas, BLOCO_LINHAS)):
+            n = min(BLOCO_LINHAS, linhas - ini)
+            texto = gerar_bloco(n, seed, b, ini, pct_malformadas=pct_malformadas).to_csv(index=False, header=False, sep=sep)
+            rng = np.random.default_rng([seed, b, 1])
+            k = int(n * pct_malformadas / 2)
+            if k:
+                partes = texto.splitlines(keepends=True)
+                for pos, linha in zip(np.sort(rng.integers(0, len(partes), k))[::-1], _linhas_quebradas(rng, k, sep)):
+                    partes.insert(int(pos), linha + "\n")
+                texto = "".join(partes)
+            f.write(texto)
+            if progresso: progresso(ini + n, linhas)
+    os.replace(tmp, caminho)
+    return caminho
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Gera um chats_resume sintético e determinístico.")
+    ap.add_argument("--linhas", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--sep", default=",")
+    ap.add_argument("--pct-malformadas", type=float, default=0.002)
+    ap.add_argument("--saida", required=True)
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    gerar_csv(args.saida, args.linhas, args.seed, args.sep, args.pct_malformadas,
+              progresso=lambda feito, total: print(f"\r{feito:,}/{total:,}", end="", file=sys.stderr))
+    print(f"\n{args.saida}: {os.path.getsize(args.saida) / 1024**2:.1f} MB em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1520 @@
+# nucleo.py — camada de dados sem Streamlit: ingestão do CSV, processamento, cubo/sketches,
+# KPIs por responsável e notas da ficha. Usado pelo app.py e pelo relatorio_lote.py.
+import pandas as pd
+import numpy as np
+import io
+import re
+import time
+import json
+from datetime import datetime, date, time as dtime
+import unicodedata
+import difflib
+import hashlib
+import csv
+import warnings
+import inspect
+import os
+import tempfile
+import sqlite3
+import threading
+from contextlib import contextmanager
+import requests
+from typing import Dict, List, Tuple, Optional
+
+# ============================ LINK FIXO (SALVO) ============================
+DEFAULT_CSV_URL = (
+    "https://uploads-tiflux.s3.sa-east-1.amazonaws.com/dw/"
+    "d54f42553a9baa18ab1411eaa048dd87dd047e54ff62ca9677408b6c6a0d9f39/"
+    "f3e399e20dcfd11907bcab6d93520e7b7641419373f107271c63260b571b7c2d/6595/"
+    "chats_resume_latest.csv"
+)
+
+# ============================ MEDIÇÃO DE ETAPAS ============================
+# Spans leves: quem inicia a coleta (um rerun do app, por exemplo) recebe o tempo somado e o
+# nº de linhas de cada etapa. Sem coleta ativa (CLI, benchmark) as etapas não custam nada.
+_coletor = threading.local()
+
+def iniciar_coleta() -> dict:
+    _coletor.atual = {"etapas": {}, "linhas": {}}
+    return _coletor.atual
+
+def coleta_atual() -> Optional[dict]:
+    return getattr(_coletor, "atual", None)
+
+def encerrar_coleta() -> Optional[dict]:
+    c = coleta_atual(); _coletor.atual = None
+    return c
+
+def registrar_etapa(nome: str, segundos: float, linhas: Optional[int] = None):
+    c = coleta_atual()
+    if c is None: return
+    c["etapas"][nome] = c["etapas"].get(nome, 0.0) + segundos
+    if linhas is not None: c["linhas"][nome] = c["linhas"].get(nome, 0) + int(linhas)
+
+@contextmanager
+def etapa(nome: str):
+    # with etapa("x") as sp: ...; sp["linhas"] = n
+    sp = {"linhas": None}
+    if coleta_atual() is None:
+        yield sp; return
+    t0 = time.perf_counter()
+    try:
+        yield sp
+    finally:
+        registrar_etapa(nome, time.perf_counter() - t0, sp["linhas"])
+
+# ================================ ARQUIVOS JSON ================================
+def _atomic_write(path, data):
+    d = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=d)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp, path)
+
+# Backend de usuários/fichas: "sqlite" (padrão; uma linha por ficha/meta, salvar só toca o que mudou)
+# ou "json" (users.json/fichas.json reescritos inteiros, como antes).
+ARMAZENAMENTO = os.getenv("ARMAZENAMENTO", "sqlite").strip().lower()
+USERS_JSON, FICHAS_JSON = "users.json", "fichas.json"
+
+def _load_users_json(avisar=None):
+    try:
+        with open(USERS_JSON, 'r', encoding='utf-8') as f: return json.load(f)
+    except FileNotFoundError:
+        if avisar: avisar(f"Arquivo '{USERS_JSON}' não encontrado.")
+        return []
+    except json.JSONDecodeError:
+        if avisar: avisar(f"Falha ao ler '{USERS_JSON}' (JSON inválido).")
+        return []
+
+def _load_fichas_json():
+    try:
+        with open(FICHAS_JSON, 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# ---------------- SQLite (WAL) ----------------
+# users(username, role, ordem, corpo) • fichas(id, username, data_ts, corpo com metas vazio)
+# • metas(ficha_id, idx, corpo). corpo = o dict original em JSON; as colunas ao lado
+# existem para índice/ordem. Fichas saem da mais recente para a mais antiga (id decrescente),
+# como a lista do fichas.json.
+DB_PATH = os.getenv("NOVETECH_DB", "novetech.db")
+_ESQUEMA_SQL = """
+CREATE TABLE IF NOT EXISTS esquema (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY, role TEXT, ordem INTEGER NOT NULL, corpo TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_users_role ON users (role, ordem);
+CREATE TABLE IF NOT EXISTS fichas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, data_ts TEXT, corpo TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_fichas_usuario ON fichas (username, id);
+CREATE INDEX IF NOT EXISTS ix_fichas_usuario_data ON fichas (username, data_ts);
+CREATE TABLE IF NOT EXISTS metas (
+    ficha_id INTEGER NOT NULL REFERENCES fichas (id) ON DELETE CASCADE, idx INTEGER NOT NULL,
+    corpo TEXT NOT NULL, PRIMARY KEY (ficha_id, idx));
+CREATE TABLE IF NOT EXISTS notas_fichas (
+    ficha_id INTEGER PRIMARY KEY REFERENCES fichas (id) ON DELETE CASCADE, username TEXT NOT NULL, data_ts TEXT,
+    nota_final REAL, nota_ferramentas REAL, nota_competencias REAL, conceito TEXT, estrelinhas TEXT, cultura_valores TEXT);
+CREATE INDEX IF NOT EXISTS ix_notas_usuario ON notas_fichas (username, ficha_id);
+CREATE TABLE IF NOT EXISTS ranking_tecnicos (
+    username TEXT PRIMARY KEY, n_fichas INTEGER NOT NULL, ultima_data TEXT, nota_final REAL, nota_anterior REAL,
+    nota_ferramentas REAL, nota_competencias REAL, conceito TEXT, estrelinhas TEXT, cultura_valores TEXT,
+    inclinacao REAL, atualizado_em TEXT);
+"""
+_db_prontos, _db_lock = set(), threading.Lock()
+
+@contextmanager
+def _conexao(escrita: bool = False, caminho: Optional[str] = None, preparar=None):
+    # conexão curta por operação (threads do Streamlit vêm e vão); escrita = transação IMMEDIATE
+    caminho = caminho or DB_PATH
+    con = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    try:
+        con.execute("PRAGMA foreign_keys = ON"); con.execute("PRAGMA synchronous = NORMAL")
+        if caminho not in _db_prontos: (preparar or _preparar_db)(con, caminho)
+        if not escrita:
+            yield con; return
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK"); raise
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+def _preparar_db(con, caminho: str):
+    with _db_lock:
+        if caminho in _db_prontos: return
+        con.execute("PRAGMA journal_mode = WAL")
+        con.executescript(_ESQUEMA_SQL)
+        con.execute("BEGIN IMMEDIATE")  # outro processo pode estar migrando ao mesmo tempo
+        try:
+            if con.execute("SELECT 1 FROM esquema WHERE chave = 'migrado_de_json'").fetchone() is None:
+                _migrar_json(con)
+            if con.execute("SELECT 1 FROM esquema WHERE chave = 'ranking_v1'").fetchone() is None:
+                _reconstruir_ranking(con)  # bancos criados antes das tabelas de ranking
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK"); raise
+        _db_prontos.add(caminho)
+
+def _data_ts(ficha: dict) -> Optional[str]:
+    try: return datetime.strptime(ficha.get("data", ""), "%d/%m/%Y %H:%M").strftime("%Y-%m-%dT%H:%M")
+    except (TypeError, ValueError): return None
+
+def _gravar_users(con, users: List[dict]):
+    con.execute("DELETE FROM users")
+    con.executemany("INSERT INTO users (username, role, ordem, corpo) VALUES (?, ?, ?, ?)",
+                    [(u.get("username"), u.get("role"), i, json.dumps(u, ensure_ascii=False)) for i, u in enumerate(users)])
+
+def _inserir_ficha(con, username: str, ficha: dict) -> int:
+    # quem chama atualiza ranking_tecnicos do username depois (_atualizar_ranking)
+    corpo = {k: ([] if k == "metas" else v) for k, v in ficha.items()}  # metas vão para a tabela própria
+    fid = con.execute("INSERT INTO fichas (username, data_ts, corpo) VALUES (?, ?, ?)",
+                      (username, _data_ts(ficha), json.dumps(corpo, ensure_ascii=False))).lastrowid
+    con.execute("INSERT INTO notas_fichas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (fid, username) + _notas_da_ficha(ficha))
+    if "metas" in ficha:
+        con.executemany("INSERT INTO metas (ficha_id, idx, corpo) VALUES (?, ?, ?)",
+                        [(fid, i, json.dumps(m, ensure_ascii=False)) for i, m in enumerate(ficha["metas"] or [])])
+    return fid
+
+def _gravar_fichas(con, data: Dict[str, List[dict]]):
+    con.execute("DELETE FROM fichas"); con.execute("DELETE FROM ranking_tecnicos")
+    for username, lista in data.items():
+        for ficha in reversed(lista or []): _inserir_ficha(con, username, ficha)  # mais antiga primeiro: id cresce com o tempo
+        _atualizar_ranking(con, username)
+
+# ---- Ranking materializado: notas por ficha + uma linha por técnico, refeita só para quem recebeu ficha ----
+TENDENCIA_CICLOS = 6  # inclinação = reta de mínimos quadrados sobre as últimas N notas finais (pontos por ciclo)
+
+def _num(v) -> Optional[float]:
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+def _notas_da_ficha(ficha: dict) -> tuple:
+    # (data_ts, nota_final, ferramentas 0–10, competências 0–10, conceito, estrelinhas, cultura)
+    ferr = (ficha.get("desempenho_ferramentas") or {}).get("indice_ponderado_pct")
+    comp = (ficha.get("competencias") or {}).get("nota_competencias_ponderada")
+    return (_data_ts(ficha), _num(ficha.get("nota_final")), None if _num(ferr) is None else _num(ferr) / 10.0,
+            _num(comp), ficha.get("conceito"), ficha.get("estrelinhas"), ficha.get("cultura_valores"))
+
+def _inclinacao(notas: List[float]) -> Optional[float]:
+    # notas da mais antiga para a mais recente
+    notas = [v for v in notas if v is not None]
+    if len(notas) < 2: return None
+    return round(float(np.polyfit(np.arange(len(notas)), notas, 1)[0]), 6) + 0.0  # + 0.0: sem "-0.00"
+
+def _atualizar_ranking(con, username: str):
+    n = con.execute("SELECT COUNT(*) FROM notas_fichas WHERE username = ?", (username,)).fetchone()[0]
+    if not n:
+        con.execute("DELETE FROM ranking_tecnicos WHERE username = ?", (username,)); return
+    ult = con.execute("SELECT data_ts, nota_final, nota_ferramentas, nota_competencias, conceito, estrelinhas, cultura_valores "
+                      "FROM notas_fichas WHERE username = ? ORDER BY ficha_id DESC LIMIT ?", (username, TENDENCIA_CICLOS)).fetchall()
+    con.execute("INSERT OR REPLACE INTO ranking_tecnicos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (username, n, ult[0][0], ult[0][1], ult[1][1] if len(ult) > 1 else None) + tuple(ult[0][2:])
+                + (_inclinacao([r[1] for r in reversed(ult)]), datetime.now().isoformat(timespec="seconds")))
+
+def _reconstruir_ranking(con):
+    # uma vez por banco: recalcula notas_fichas/ranking a partir do corpo das fichas
+    con.execute("DELETE FROM notas_fichas"); con.execute("DELETE FROM ranking_tecnicos")
+    for fid, username, corpo in con.execute("SELECT id, username, corpo FROM fichas ORDER BY id").fetchall():
+        con.execute("INSERT INTO notas_fichas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (fid, username) + _notas_da_ficha(json.loads(corpo)))
+    for (username,) in con.execute("SELECT DISTINCT username FROM notas_fichas").fetchall(): _atualizar_ranking(con, username)
+    con.execute("INSERT OR REPLACE INTO esquema (chave, valor) VALUES ('ranking_v1', ?)", (datetime.now().isoformat(timespec="seconds"),))
+
+def _migrar_json(con):
+    # uma vez por banco: importa users.json/fichas.json se existirem (os arquivos ficam onde estão)
+    users, fichas = _load_users_json(), _load_fichas_json()
+    if users: _gravar_users(con, users)
+    if fichas: _gravar_fichas(con, fichas)
+    con.execute("INSERT INTO esquema (chave, valor) VALUES ('migrado_de_json', ?)",
+                (json.dumps({"em": datetime.now().isoformat(timespec="seconds"), "users": len(users),
+                             "fichas": sum(len(v or []) for v in fichas.values())}),))
+    _invalidar_cache()
+
+def _montar_fichas(con, linhas) -> Dict[str, List[dict]]:
+    ids = [r[0] for r in linhas]
+    metas: Dict[int, list] = {}
+    for k in range(0, len(ids), 500):  # limite de parâmetros do SQLite
+        lote = ids[k:k + 500]
+        for fid, corpo in con.execute(f"SELECT ficha_id, corpo FROM metas WHERE ficha_id IN ({','.join('?' * len(lote))}) "
+                                      "ORDER BY ficha_id, idx", lote):
+            metas.setdefault(fid, []).append(json.loads(corpo))
+    res: Dict[str, List[dict]] = {}
+    for fid, username, corpo in linhas:
+        ficha = json.loads(corpo)
+        if "metas" in ficha: ficha["metas"] = metas.get(fid, [])
+        res.setdefault(username, []).append(ficha)
+    return res
+
+# ---------------- Cache em processo (validado por mtime/tamanho/inode dos arquivos do backend) ----------------
+# Leituras repetidas no mesmo rerun (login, abas do coordenador, painel do técnico) não voltam ao disco
+# enquanto o stat dos arquivos não muda; toda escrita por este processo limpa o cache na hora.
+# O que sai daqui é somente leitura (dict que recusa alteração, listas viram tuplas): quem precisa
+# alterar faz descongelar() e grava pela API.
+class _DictSoLeitura(dict):
+    def _recusar(self, *args, **kwargs):
+        raise TypeError("dados em cache são somente leitura (use descongelar())")
+    __setitem__ = __delitem__ = update = pop = popitem = setdefault = clear = __ior__ = _recusar
+
+    def __reduce__(self):  # pickle/deepcopy sem passar por __setitem__
+        return (_DictSoLeitura, (dict(self),))
+
+def _congelar(obj):
+    if isinstance(obj, dict): return _DictSoLeitura({k: _congelar(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)): return tuple(_congelar(v) for v in obj)
+    return obj
+
+def descongelar(obj):
+    if isinstance(obj, dict): return {k: descongelar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)): return [descongelar(v) for v in obj]
+    return obj
+
+_cache_dados: dict = {}
+_cache_dados_lock = threading.Lock()
+
+def _assinatura_store() -> tuple:
+    # no SQLite os commits caem no -wal até o checkpoint: os dois arquivos entram na assinatura
+    arquivos = (USERS_JSON, FICHAS_JSON) if ARMAZENAMENTO == "json" else (DB_PATH, DB_PATH + "-wal")
+    ass = [ARMAZENAMENTO]
+    for a in arquivos:
+        try:
+            st_ = os.stat(a); ass.append((st_.st_mtime_ns, st_.st_size, st_.st_ino))
+        except OSError:
+            ass.append(None)
+    return tuple(ass)
+
+def _em_cache(chave, carregar, guardar_vazio: bool = True):
+    ass = _assinatura_store()  # antes de ler: se o arquivo mudar durante a leitura, a próxima chamada relê
+    with _cache_dados_lock:
+        ent = _cache_dados.get(chave)
+        if ent is not None and ent[0] == ass: return ent[1]
+    valor = _congelar(carregar())
+    if valor or guardar_vazio:
+        with _cache_dados_lock: _cache_dados[chave] = (ass, valor)
+    return valor
+
+def _invalidar_cache():
+    with _cache_dados_lock: _cache_dados.clear()
+
+# ---------------- API (mesma forma do JSON: lista de usuários, {username: [fichas]}) ----------------
+def _ler_users(avisar=None) -> List[dict]:
+    if ARMAZENAMENTO == "json": return _load_users_json(avisar)
+    with _conexao() as con:
+        users = [json.loads(c) for (c,) in con.execute("SELECT corpo FROM users ORDER BY ordem")]
+    if not users and avisar: avisar(f"Nenhum usuário cadastrado em '{DB_PATH}'.")
+    return users
+
+def load_users(avisar=None):
+    # avisar: callback de erro (st.error na UI; None no modo headless). Lista vazia não fica em cache (avisa de novo)
+    with etapa("load_users"):
+        return _em_cache("users", lambda: _ler_users(avisar), guardar_vazio=False)
+
+def save_users(data):
+    try:
+        if ARMAZENAMENTO == "json": return _atomic_write(USERS_JSON, descongelar(data))
+        with _conexao(escrita=True) as con: _gravar_users(con, data)
+    finally:
+        _invalidar_cache()
+
+def adicionar_usuario(user: dict):
+    if ARMAZENAMENTO == "json": return save_users(list(load_users()) + [user])
+    with _conexao(escrita=True) as con:
+        ordem = con.execute("SELECT COALESCE(MAX(ordem), -1) + 1 FROM users").fetchone()[0]
+        con.execute("INSERT INTO users (username, role, ordem, corpo) VALUES (?, ?, ?, ?)",
+                    (user.get("username"), user.get("role"), ordem, json.dumps(user, ensure_ascii=False)))
+    _invalidar_cache()
+
+def _ler_fichas() -> Dict[str, List[dict]]:
+    if ARMAZENAMENTO == "json": return _load_fichas_json()
+    with _conexao() as con:
+        return _montar_fichas(con, con.execute("SELECT id, username, corpo FROM fichas ORDER BY username, id DESC").fetchall())
+
+def _ler_fichas_do_usuario(username: str) -> List[dict]:
+    if ARMAZENAMENTO == "json": return _load_fichas_json().get(username, [])
+    with _conexao() as con:
+        linhas = con.execute("SELECT id, username, corpo FROM fichas WHERE username = ? ORDER BY id DESC",
+                             (username,)).fetchall()
+        return _montar_fichas(con, linhas).get(username, [])
+
+def load_fichas():
+    with etapa("load_fichas"):
+        return _em_cache("fichas", _ler_fichas)
+
+def fichas_do_usuario(username: str) -> Tuple[dict, ...]:
+    # só as fichas de um técnico (índice por username), da mais recente para a mais antiga
+    with etapa("load_fichas"):
+        return _em_cache(("fichas", username), lambda: _ler_fichas_do_usuario(username))
+
+# ---- Histórico paginado: linhas-resumo por página + ficha completa só quando aberta ----
+# id da ficha: rowid no SQLite; no backend JSON, a posição contada da mais antiga (não muda quando entra uma nova)
+CAMPOS_RESUMO_FICHA = ("data", "avaliador", "nota_final", "conceito")
+
+def _ler_resumo_fichas(username: str, inicio: int, limite: int) -> List[dict]:
+    if ARMAZENAMENTO == "json":
+        lista = _load_fichas_json().get(username, [])
+        return [{"id": len(lista) - 1 - i, **{c: f.get(c) for c in CAMPOS_RESUMO_FICHA}}
+                for i, f in enumerate(lista[inicio:inicio + limite], start=inicio)]
+    cols = ", ".join(f"json_extract(corpo, '$.{c}')" for c in CAMPOS_RESUMO_FICHA)
+    with _conexao() as con:
+        linhas = con.execute(f"SELECT id, {cols} FROM fichas WHERE username = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                             (username, limite, inicio)).fetchall()
+    return [dict(zip(("id",) + CAMPOS_RESUMO_FICHA, l)) for l in linhas]
+
+def _ler_ficha_por_id(username: str, ficha_id: int) -> Optional[dict]:
+    if ARMAZENAMENTO == "json":
+        lista = _load_fichas_json().get(username, [])
+        return lista[len(lista) - 1 - ficha_id] if 0 <= ficha_id < len(lista) else None
+    with _conexao() as con:
+        linhas = con.execute("SELECT id, username, corpo FROM fichas WHERE id = ? AND username = ?",
+                             (ficha_id, username)).fetchall()
+        return (_montar_fichas(con, linhas).get(username) or [None])[0]
+
+def contar_fichas(username: str) -> int:
+    def _contar():
+        if ARMAZENAMENTO == "json": return len(_load_fichas_json().get(username, []))
+        with _conexao() as con:
+            return con.execute("SELECT COUNT(*) FROM fichas WHERE username = ?", (username,)).fetchone()[0]
+    return _em_cache(("n_fichas", username), _contar)
+
+def resumo_fichas(username: str, inicio: int = 0, limite: int = 10) -> Tuple[dict, ...]:
+    # uma página do histórico (mais recente primeiro): id + data, avaliador, nota_final, conceito
+    with etapa("load_fichas"):
+        return _em_cache(("resumo_fichas", username, inicio, limite), lambda: _ler_resumo_fichas(username, inicio, limite))
+
+def ficha_por_id(username: str, ficha_id: int) -> Optional[dict]:
+    with etapa("load_fichas"):
+        return _em_cache(("ficha", username, ficha_id), lambda: _ler_ficha_por_id(username, ficha_id), guardar_vazio=False)
+
+def save_fichas(data):
+    # regrava tudo (importação/compatibilidade); no dia a dia use adicionar_ficha/atualizar_meta
+    try:
+        if ARMAZENAMENTO == "json": return _atomic_write(FICHAS_JSON, descongelar(data))
+        with _conexao(escrita=True) as con: _gravar_fichas(con, data)
+    finally:
+        _invalidar_cache()
+
+def adicionar_ficha(username: str, ficha: dict):
+    # nova ficha vira a mais recente do técnico
+    try:
+        if ARMAZENAMENTO == "json":
+            fichas = _load_fichas_json(); fichas.setdefault(username, []).insert(0, ficha)
+            return _atomic_write(FICHAS_JSON, fichas)
+        with _conexao(escrita=True) as con:
+            _inserir_ficha(con, username, ficha); _atualizar_ranking(con, username)
+    finally:
+        _invalidar_cache()
+
+def atualizar_meta(username: str, idx: int, campos: dict) -> bool:
+    # altera só a meta idx da ficha mais recente do técnico; False se ela não existir
+    try:
+        return _atualizar_meta(username, idx, campos)
+    finally:
+        _invalidar_cache()
+
+def _atualizar_meta(username: str, idx: int, campos: dict) -> bool:
+    if ARMAZENAMENTO == "json":
+        fichas = _load_fichas_json()
+        metas = (fichas.get(username) or [{}])[0].get("metas", [])
+        if not 0 <= idx < len(metas): return False
+        metas[idx].update(campos); _atomic_write(FICHAS_JSON, fichas)
+        return True
+    with _conexao(escrita=True) as con:
+        lin = con.execute("SELECT m.ficha_id, m.corpo FROM metas m WHERE m.idx = ? AND m.ficha_id = "
+                          "(SELECT id FROM fichas WHERE username = ? ORDER BY id DESC LIMIT 1)", (idx, username)).fetchone()
+        if lin is None: return False
+        meta = {**json.loads(lin[1]), **campos}
+        con.execute("UPDATE metas SET corpo = ? WHERE ficha_id = ? AND idx = ?",
+                    (json.dumps(meta, ensure_ascii=False), lin[0], idx))
+    return True
+
+COLUNAS_RANKING = ("username", "n_fichas", "ultima_data", "nota_final", "nota_anterior", "nota_ferramentas",
+                   "nota_competencias", "conceito", "estrelinhas", "cultura_valores", "inclinacao")
+COLUNAS_SERIE_NOTAS = ("username", "data_ts", "nota_final", "nota_ferramentas", "nota_competencias")
+
+def _ranking_de_fichas(fichas: Dict[str, List[dict]]) -> List[dict]:
+    # backend JSON: mesmo resultado, calculado da árvore inteira (fica em cache até o arquivo mudar)
+    res = []
+    for username, lista in fichas.items():
+        if not lista: continue
+        notas = [_notas_da_ficha(f) for f in lista[:TENDENCIA_CICLOS]]
+        res.append(dict(zip(COLUNAS_RANKING, (username, len(lista), notas[0][0], notas[0][1],
+                                              notas[1][1] if len(notas) > 1 else None) + tuple(notas[0][2:])
+                            + (_inclinacao([n[1] for n in reversed(notas)]),))))
+    return res
+
+def _ler_ranking() -> List[dict]:
+    if ARMAZENAMENTO == "json": return _ranking_de_fichas(_load_fichas_json())
+    with _conexao() as con:
+        return [dict(zip(COLUNAS_RANKING, r)) for r in con.execute(f"SELECT {', '.join(COLUNAS_RANKING)} FROM ranking_tecnicos")]
+
+def ranking_equipe() -> Tuple[dict, ...]:
+    # uma linha por técnico com ficha: última nota (e a anterior), notas dos blocos, conceito e inclinação
+    with etapa("ranking"):
+        return _em_cache("ranking", _ler_ranking)
+
+def _ler_serie_notas(usernames: Tuple[str, ...]) -> List[dict]:
+    if ARMAZENAMENTO == "json":
+        fichas = _load_fichas_json()
+        return [dict(zip(COLUNAS_SERIE_NOTAS, (u,) + _notas_da_ficha(f)[:4])) for u in usernames for f in reversed(fichas.get(u, []))]
+    with _conexao() as con:
+        linhas = con.execute(f"SELECT {', '.join(COLUNAS_SERIE_NOTAS)} FROM notas_fichas WHERE username IN "
+                             f"({','.join('?' * len(usernames))}) ORDER BY username, ficha_id", usernames).fetchall()
+    return [dict(zip(COLUNAS_SERIE_NOTAS, l)) for l in linhas]
+
+def serie_notas(usernames) -> Tuple[dict, ...]:
+    # notas por ciclo (mais antiga primeiro) dos técnicos pedidos — base do gráfico de evolução
+    usernames = tuple(sorted(set(usernames)))
+    if not usernames: return ()
+    with etapa("ranking"):
+        return _em_cache(("serie_notas", usernames), lambda: _ler_serie_notas(usernames))
+
+def exportar_json(destino: str = ".") -> Tuple[str, str]:
+    # users.json/fichas.json no formato antigo, a partir do backend atual (compatibilidade/backup)
+    caminhos = (os.path.join(destino, USERS_JSON), os.path.join(destino, FICHAS_JSON))
+    _atomic_write(caminhos[0], load_users()); _atomic_write(caminhos[1], load_fichas())
+    return caminhos
+
+def _safe_filename(name: str) -> str:
+    base = unicodedata.normalize('NFKD', name).encode('ascii','ignore').decode()
+    base = re.sub(r'[^A-Za-z0-9_.-]+', '_', base).strip('_')
+    return base[:120] or "arquivo"
+
+# ---------------- Certificados (armazenados por conteúdo: SHA-256) ----------------
+# Arquivo em <CERT_DIR>/sha256/ab/abcd…; o mesmo PDF enviado de novo aponta para o mesmo arquivo.
+# O upload é copiado em blocos para um temporário enquanto o hash é calculado (com limite de
+# tamanho); metadados ficam em <CERT_DIR>/indice.db e imagens ganham miniatura PNG (Pillow opcional).
+CERT_DIR = os.getenv("CERTIFICADOS_DIR", os.path.join("uploads", "certificados"))
+CERT_MAX_BYTES = int(float(os.getenv("CERTIFICADO_MAX_MB", "10")) * 1024 * 1024)  # no app, server.maxUploadSize barra antes
+CERT_BLOCO = 1024 * 1024
+MINIATURA_PX = 240
+_ESQUEMA_CERT_SQL = """
+CREATE TABLE IF NOT EXISTS certificados (
+    sha256 TEXT PRIMARY KEY, tamanho INTEGER NOT NULL, mime TEXT, nome_original TEXT,
+    enviado_por TEXT, criado_em TEXT NOT NULL, envios INTEGER NOT NULL DEFAULT 1, miniatura INTEGER NOT NULL DEFAULT 0);
+"""
+_ASSINATURAS_MIME = ((b"%PDF-", "application/pdf"), (b"\x89PNG\r\n\x1a\n", "image/png"), (b"\xff\xd8\xff", "image/jpeg"))
+
+def _indice_cert() -> str:
+    return os.path.join(CERT_DIR, "indice.db")
+
+def _preparar_indice_cert(con, caminho: str):
+    with _db_lock:
+        con.execute("PRAGMA journal_mode = WAL"); con.executescript(_ESQUEMA_CERT_SQL)
+        _db_prontos.add(caminho)
+
+def caminho_certificado(sha256: str) -> str:
+    return os.path.join(CERT_DIR, "sha256", sha256[:2], sha256)
+
+def _arquivo_miniatura(sha256: str) -> str:
+    return os.path.join(CERT_DIR, "miniaturas", f"{sha256}.png")
+
+def caminho_miniatura(sha256: str) -> Optional[str]:
+    p = _arquivo_miniatura(sha256)
+    return p if os.path.exists(p) else None
+
+def _gerar_miniatura(origem: str, sha256: str) -> bool:
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    tmp = None
+    try:
+        destino = _arquivo_miniatura(sha256)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with Image.open(origem) as img:
+            img.thumbnail((MINIATURA_PX, MINIATURA_PX))
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".png"); os.close(fd)
+            img.convert("RGB").save(tmp, "PNG")
+        os.replace(tmp, destino)
+        return True
+    except Exception:
+        if tmp and os.path.exists(tmp): os.remove(tmp)
+        return False
+
+def salvar_certificado(arquivo, nome: str, enviado_por: Optional[str] = None) -> dict:
+    # arquivo: objeto com read(n) (UploadedFile do Streamlit, open(..., "rb")). ValueError se passar do limite
+    tmp_dir = os.path.join(CERT_DIR, "tmp"); os.makedirs(tmp_dir, exist_ok=True)
+    if hasattr(arquivo, "seek"): arquivo.seek(0)
+    h, tamanho, inicio = hashlib.sha256(), 0, b""
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                bloco = arquivo.read(CERT_BLOCO)
+                if not bloco: break
+                tamanho += len(bloco)
+                if tamanho > CERT_MAX_BYTES:
+                    raise ValueError(f"Certificado maior que o limite de {CERT_MAX_BYTES / 1024**2:.0f} MB.")
+                if len(inicio) < 16: inicio += bloco[:16]
+                h.update(bloco); f.write(bloco)
+        if tamanho == 0: raise ValueError("Arquivo de certificado vazio.")
+        sha = h.hexdigest(); destino = caminho_certificado(sha)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino): os.remove(tmp)  # mesmo conteúdo já guardado
+        else: os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    mime = next((m for assin, m in _ASSINATURAS_MIME if inicio.startswith(assin)), "application/octet-stream")
+    mini = mime.startswith("image/") and (caminho_miniatura(sha) is not None or _gerar_miniatura(destino, sha))
+    with _conexao(escrita=True, caminho=_indice_cert(), preparar=_preparar_indice_cert) as con:
+        con.execute("INSERT INTO certificados (sha256, tamanho, mime, nome_original, enviado_por, criado_em, miniatura) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (sha256) DO UPDATE SET envios = envios + 1, "
+                    "miniatura = MAX(miniatura, excluded.miniatura)",
+                    (sha, tamanho, mime, _safe_filename(nome), enviado_por, datetime.now().isoformat(timespec="seconds"), int(mini)))
+    return {"sha256": sha, "caminho": destino, "tamanho": tamanho, "mime": mime, "nome": _safe_filename(nome)}
+
+def infos_certificados(shas) -> Dict[str, dict]:
+    # {sha256: metadados do índice} numa consulta só (uma ficha/página do histórico), sem tocar nos arquivos;
+    # "miniatura" vira o caminho do PNG (ou None). Hash fora do índice simplesmente não aparece
+    shas = sorted({s for s in shas if s})
+    if not shas or not os.path.exists(_indice_cert()): return {}
+    with _conexao(caminho=_indice_cert(), preparar=_preparar_indice_cert) as con:
+        con.row_factory = sqlite3.Row
+        linhas = con.execute(f"SELECT * FROM certificados WHERE sha256 IN ({','.join('?' * len(shas))})", shas).fetchall()
+    res = {}
+    for lin in linhas:
+        info = dict(lin); sha = info["sha256"]
+        info.update(caminho=caminho_certificado(sha), miniatura=_arquivo_miniatura(sha) if info["miniatura"] else None)
+        res[sha] = info
+    return res
+
+# ---------------- CSV robusto (arquivo e URL) ----------------
+AMOSTRA_DIALETO_BYTES = 64 * 1024
+SEPARADORES_CANDIDATOS = ";,\t|"
+
+def _decodificar_amostra(amostra: bytes) -> Tuple[str, str]:
+    if amostra.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig", amostra[3:].decode("utf-8", errors="ignore")
+    try:
+        return "utf-8", amostra.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start >= len(amostra) - 3:  # amostra cortou um caractere multibyte no fim
+            return "utf-8", amostra[:e.start].decode("utf-8")
+        return "latin1", amostra.decode("latin1")
+
+def detectar_dialeto(file_bytes: bytes) -> dict:
+    encoding, texto = _decodificar_amostra(file_bytes[:AMOSTRA_DIALETO_BYTES])
+    linhas = [l for l in texto.splitlines()[:50] if l.strip()]
+    if len(linhas) > 1 and not texto.endswith(("\n", "\r")) and len(file_bytes) > AMOSTRA_DIALETO_BYTES:
+        linhas = linhas[:-1]  # última linha da amostra pode estar incompleta
+    sep = None
+    try:
+        sep = csv.Sniffer().sniff("\n".join(linhas), delimiters=SEPARADORES_CANDIDATOS).delimiter
+    except csv.Error:
+        pass
+    if sep is None and linhas:
+        # fallback: separador mais frequente no cabeçalho que se repete de forma estável
+        contagens = {c: [l.count(c) for l in linhas] for c in SEPARADORES_CANDIDATOS}
+        estaveis = {c: v[0] for c, v in contagens.items() if v[0] > 0 and v.count(v[0]) >= len(v) * 0.8}
+        sep = max(estaveis, key=estaveis.get) if estaveis else max(contagens, key=lambda c: contagens[c][0])
+    return {"sep": sep or ",", "engine": "c", "encoding": encoding}
+
+def _ler_csv_com_dialeto(file_bytes: bytes, opts: dict) -> pd.DataFrame:
+    with warnings.catch_warnings(record=True) as avisos:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(io.BytesIO(file_bytes), sep=opts["sep"], engine=opts["engine"],
+                         encoding=opts["encoding"], on_bad_lines="warn")
+    descartadas = sum(str(a.message).count("Skipping line") for a in avisos
+                      if issubclass(a.category, pd.errors.ParserWarning))
+    if df.shape[1] <= 1 and any(c in str(df.columns[0]) for c in SEPARADORES_CANDIDATOS if c != opts["sep"]):
+        raise ValueError(f"Separador {opts['sep']!r} gerou uma única coluna.")
+    df.attrs["_read_opts_"] = dict(opts)
+    df.attrs["_linhas_descartadas_"] = descartadas
+    return df
+
+def _ler_csv_tentativas(file_bytes: bytes) -> pd.DataFrame:
+    tentativas = [
+        {"sep": None, "engine": "python", "encoding": "utf-8"},
+        {"sep": ";", "engine": "c", "encoding": "utf-8"},
+        {"sep": ",", "engine": "c", "encoding": "utf-8"},
+        {"sep": "\t", "engine": "c", "encoding": "utf-8"},
+        {"sep": "|", "engine": "c", "encoding": "utf-8"},
+        {"sep": None, "engine": "python", "encoding": "utf-8-sig"},
+        {"sep": None, "engine": "python", "encoding": "latin1"},
+    ]
+    last_exc = None
+    for opts in tentativas:
+        try:
+            buf = io.BytesIO(file_bytes)
+            df = pd.read_csv(buf, sep=opts["sep"], engine=opts["engine"],
+                             encoding=opts["encoding"], on_bad_lines="skip")
+            df.attrs["_read_opts_"] = opts
+            df.attrs["_linhas_descartadas_"] = None  # desconhecido neste caminho
+            return df
+        except Exception as e:
+            last_exc = e
+            continue
+    raise last_exc if last_exc else ValueError("Falha ao ler CSV.")
+
+def ler_csv_robusto(file_bytes: bytes, opts: Optional[dict] = None) -> pd.DataFrame:
+    # 1) dialeto já conhecido (ou detectado por amostra) + um único parse com engine C
+    # 2) se falhar, volta às tentativas antigas
+    with etapa("parse_csv") as sp:
+        for o in ([opts] if opts else []) + [None]:
+            try:
+                df = _ler_csv_com_dialeto(file_bytes, o or detectar_dialeto(file_bytes))
+                break
+            except Exception:
+                continue
+        else:
+            df = _ler_csv_tentativas(file_bytes)
+        sp["linhas"] = len(df)
+    return df
+
+def ler_csv_robusto_from_url(url: str, dialeto: Optional[dict] = None) -> pd.DataFrame:
+    resp = requests.get(url, timeout=60)
+    resp.raise_for_status()
+    return ler_csv_robusto(resp.content, dialeto)
+
+def baixar_csv_condicional(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+    # GET condicional: devolve (304, None, ...) quando o arquivo não mudou no servidor
+    headers = {}
+    if etag: headers["If-None-Match"] = etag
+    if last_modified: headers["If-Modified-Since"] = last_modified
+    with etapa("download"):
+        resp = requests.get(url, timeout=60, headers=headers)
+        if resp.status_code == 304:
+            return 304, None, etag, last_modified
+        resp.raise_for_status()
+        conteudo = resp.content
+    return resp.status_code, conteudo, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+# ---------------- Conversões / utilidades ----------------
+def _parse_hms(val):
+    if pd.isna(val): return None
+    s = str(val).strip()
+    if not s: return None
+    parts = s.split(":")
+    if not (1 <= len(parts) <= 3): return None
+    try: parts = [int(p) for p in parts]
+    except: return None
+    if len(parts)==1: h,m,sec = 0,0,parts[0]
+    elif len(parts)==2: h,m,sec = 0,parts[0],parts[1]
+    else: h,m,sec = parts
+    return h,m,sec
+
+def converter_para_segundos(valor):
+    try:
+        h,m,s = _parse_hms(valor) or (None,None,None)
+        if h is None: return None
+        return h*3600 + m*60 + s
+    except: return None
+
+def converter_para_minutos(valor):
+    try:
+        h,m,s = _parse_hms(valor) or (None,None,None)
+        if h is None: return None
+        return h*60 + m + s/60
+    except: return None
+
+def formatar_tempo_minutos(minutos_total):
+    if minutos_total is None or pd.isna(minutos_total): return "00:00"
+    minutos = int(minutos_total)
+    seg = int(round((minutos_total - minutos) * 60))
+    return f"{minutos:02}:{seg:02}"
+
+def linha_valida_em_colunas(row, colunas):
+    for c in colunas:
+        cell = row.get(c, None)
+        if isinstance(cell, str) and re.search(r'\w', cell): return True
+        elif pd.notna(cell): return True
+    return False
+
+def definir_turno(data_hora_str):
+    try:
+        if pd.isna(data_hora_str): return "Outro"
+        dt = pd.to_datetime(data_hora_str)
+        hora = dt.hour
+        if   7 <= hora <= 12: return "Manhã"
+        elif 13 <= hora <= 17: return "Tarde"
+        elif 18 <= hora <= 22: return "Noite"
+        else: return "Madrugada"
+    except: return "Outro"
+
+def _norm(txt: str) -> str:
+    if txt is None: return ""
+    txt = str(txt).strip().lower()
+    txt = unicodedata.normalize('NFKD', txt)
+    txt = ''.join(c for c in txt if not unicodedata.combining(c))
+    txt = re.sub(r'[^a-z0-9@._\s-]', '', txt)
+    txt = re.sub(r'\s+', ' ', txt)
+    return txt.strip()
+
+def _conceito_por_nota(n):
+    if n is None or pd.isna(n): return "N/A"
+    if n >= 9.0: return "Excelente"
+    if n >= 8.0: return "Muito Bom"
+    if n >= 7.0: return "Bom"
+    if n >= 6.0: return "Regular"
+    return "A Melhorar"
+
+def _estrela_por_nota(n):
+    if n is None or pd.isna(n): return "⭐"
+    if n >= 9.0: return "⭐⭐⭐⭐⭐"
+    if n >= 8.0: return "⭐⭐⭐⭐"
+    if n >= 7.0: return "⭐⭐⭐"
+    if n >= 6.0: return "⭐⭐"
+    return "⭐"
+
+# ---------------- Notas da ficha (mesma ponderação das abas do coordenador) ----------------
+def indice_proficiencia(entradas: Dict[str, float], pesos: Dict[str, float]) -> float:
+    # 0–100, média das proficiências ponderada pelos pesos das ferramentas
+    soma_w = sum(pesos.values())
+    return 0.0 if soma_w <= 0 else sum(entradas[n] * pesos.get(n, 0) for n in entradas) / soma_w
+
+def nota_competencias(notas: Dict[str, float], pesos: Dict[str, float]) -> float:
+    soma_w = sum(pesos.values())
+    return 0.0 if soma_w <= 0 else sum(notas[k] * pesos.get(k, 0) for k in notas) / soma_w
+
+def nota_final(prof_pct: float, nota_comp: float, pesos_blocos: Dict[str, float]) -> float:
+    # proficiência (0–100 → 0–10) e competências (0–10) combinadas pelos pesos dos blocos (%)
+    return (prof_pct / 10.0) * pesos_blocos["Ferramentas"] / 100.0 + nota_comp * pesos_blocos["Competências"] / 100.0
+
+def kpi_do_tecnico(tecnico: dict, kpis_norm: dict, alias_map: Optional[dict] = None):
+    # vínculo técnico → responsável do CSV: alias manual, nome/usuário normalizados, depois fuzzy
+    if not tecnico: return (None, None)
+    manual_key = (alias_map or {}).get(tecnico.get("username","").lower())
+    if manual_key and manual_key in kpis_norm:
+        return manual_key, kpis_norm[manual_key]
+    candidatos = {_norm(tecnico.get("name","")), _norm(tecnico.get("username",""))}
+    user = tecnico.get("username","")
+    if "@" in user: candidatos.add(_norm(user.split("@")[0]))
+    for c in list(candidatos):
+        if c in kpis_norm: return c, kpis_norm[c]
+    keys = list(kpis_norm.keys())
+    for c in list(candidatos):
+        m = difflib.get_close_matches(c, keys, n=1, cutoff=0.82)
+        if m: return m[0], kpis_norm[m[0]]
+    return (None, None)
+
+# ==================== FILTRO & KPIs (com período) ======================
+META_AVALIACAO, META_DURACAO_MINUTOS, META_ESPERA_SEGUNDOS = 4.8, 28.0, 20.0  # SLAs do suporte
+META_POR_METRICA = {"duracao_minutos": META_DURACAO_MINUTOS, "tempo_espera_segundos": META_ESPERA_SEGUNDOS}
+
+def period_bounds(start_date: date, end_date: date) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    start_ts = pd.Timestamp.combine(start_date, dtime.min)
+    end_ts = pd.Timestamp.combine(end_date, dtime.max)
+    return start_ts, end_ts
+
+def period_mask(series_dt: pd.Series, start_date: date, end_date: date) -> pd.Series:
+    s = series_dt.copy()
+    try:
+        if pd.api.types.is_datetime64tz_dtype(s):
+            s = s.dt.tz_convert(None)
+    except Exception:
+        try:
+            s = s.dt.tz_localize(None)
+        except Exception:
+            pass
+    start_ts, end_ts = period_bounds(start_date, end_date)
+    return s.between(start_ts, end_ts, inclusive="both")
+
+def _norm_serie(s: pd.Series) -> pd.Series:
+    # mesma regra de _norm, em coluna (acentos somem no NFKD + filtro de caracteres)
+    s = s.astype(str).str.strip().str.lower().str.normalize("NFKD")
+    s = s.str.replace(r'[^a-z0-9@._\s-]', '', regex=True).str.replace(r'\s+', ' ', regex=True)
+    return s.str.strip()
+
+def compute_kpis_por_responsavel(df: pd.DataFrame):
+    kpis_norm, labels_orig = {}, set()
+    if "responsible" not in df.columns or df.empty: return kpis_norm, labels_orig
+    base = {"responsible": df["responsible"].astype(str).str.strip().to_numpy()}
+    aggs = {"qtd": ("responsible", "size")}
+    for col, nome in (("rating", "rating_media"), ("duracao_minutos", "duracao_media"),
+                      ("tempo_espera_segundos", "espera_media")):
+        if col in df.columns:
+            base[col] = df[col].astype("float64").to_numpy(); aggs[nome] = (col, "mean")
+    base = pd.DataFrame(base)
+    base = base[base["responsible"].str.len() > 0]
+    if base.empty: return kpis_norm, labels_orig
+    df_k = base.groupby("responsible", dropna=True).agg(**aggs).reset_index()
+
+    resp = df_k["responsible"].astype(str).str.strip()
+    k_nome = _norm_serie(resp)
+    k_user = _norm_serie(resp.str.split("@", n=1).str[0]).where(resp.str.contains("@", regex=False))
+    par = resp.str.extract(r"\(([^)]+)\)")[0]
+    k_par = _norm_serie(par.fillna("")).where(par.notna())
+    for c in ("rating_media", "duracao_media", "espera_media"):
+        if c not in df_k.columns: df_k[c] = float("nan")
+    registros = df_k.assign(_label=resp, _k1=k_nome, _k2=k_user, _k3=k_par).to_dict("records")
+    for r in registros:
+        labels_orig.add(r["_label"])
+        data = {
+            "responsavel_label": r["_label"],
+            "qtd": int(r["qtd"]),
+            "rating_media": float(r["rating_media"]) if pd.notna(r["rating_media"]) else None,
+            "duracao_media": float(r["duracao_media"]) if pd.notna(r["duracao_media"]) else None,
+            "espera_media": float(r["espera_media"]) if pd.notna(r["espera_media"]) else None,
+        }
+        for k in (r["_k1"], r["_k2"], r["_k3"]):
+            if isinstance(k, str) and k: kpis_norm[k] = data
+    return kpis_norm, sorted(labels_orig)
+
+# Frames ordenados por created_dt (NaT no fim) na ingestão: o filtro vira busca binária
+ATTR_ORDENADO = "_ordenado_created_dt_"
+
+def ordenar_por_data(df: pd.DataFrame, chaves: Optional[pd.Series] = None):
+    if "created_dt" not in df.columns or not pd.api.types.is_datetime64_dtype(df["created_dt"]):
+        return df, chaves
+    pos = df["created_dt"].reset_index(drop=True).sort_values(kind="stable", na_position="last").index
+    df = df.iloc[pos].reset_index(drop=True)
+    if chaves is not None: chaves = chaves.iloc[pos].set_axis(range(len(df)))
+    df.attrs[ATTR_ORDENADO] = True
+    return df, chaves
+
+def marcar_se_ordenado(df: pd.DataFrame) -> pd.DataFrame:
+    # para frames que vêm do disco (attrs não sobrevivem ao Parquet)
+    if "created_dt" in df.columns and pd.api.types.is_datetime64_dtype(df["created_dt"]):
+        s = df["created_dt"]
+        n_validos = int(s.notna().sum())
+        if s.iloc[n_validos:].isna().all() and s.iloc[:n_validos].is_monotonic_increasing:
+            df.attrs[ATTR_ORDENADO] = True
+    return df
+
+def _datas_ordenadas(df: pd.DataFrame) -> Optional[np.ndarray]:
+    if not df.attrs.get(ATTR_ORDENADO) or "created_dt" not in df.columns: return None
+    arr = df["created_dt"].to_numpy()
+    return arr if np.issubdtype(arr.dtype, np.datetime64) else None
+
+def faixa_datas(df: pd.DataFrame) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    arr = _datas_ordenadas(df)
+    if arr is not None:
+        fim = int(np.searchsorted(arr, np.datetime64("NaT"), side="left"))  # NaT ficam no fim
+        return (pd.Timestamp(arr[0]), pd.Timestamp(arr[fim - 1])) if fim > 0 else (None, None)
+    valid_dt = df["created_dt"].dropna()
+    return (valid_dt.min(), valid_dt.max()) if not valid_dt.empty else (None, None)
+
+def filter_df_by_period(df: pd.DataFrame, start_date: date, end_date: date) -> pd.DataFrame:
+    # Retorna fatia sem cópia quando o frame está ordenado — não alterar o resultado in-place.
+    if "created_dt" not in df.columns or start_date is None or end_date is None:
+        return df
+    arr = _datas_ordenadas(df)
+    if arr is not None:
+        start_ts, end_ts = period_bounds(start_date, end_date)
+        i0 = int(np.searchsorted(arr, start_ts.to_datetime64().astype(arr.dtype), side="left"))
+        i1 = int(np.searchsorted(arr, end_ts.to_datetime64().astype(arr.dtype), side="right"))
+        return df.iloc[i0:i1]
+    mask = period_mask(df["created_dt"], start_date, end_date)
+    return df.loc[mask].copy()
+
+# ==================== INGESTÃO E PROCESSAMENTO ====================
+# Caminho de ingestão: "vetorizado" (padrão), "legado" (linha a linha) ou
+# "comparar" (roda os dois, confere se o resultado é idêntico e mede o tempo).
+INGESTAO_MODO = os.getenv("INGESTAO_MODO", "vetorizado").strip().lower()
+
+COLUNAS_NECESSARIAS = [
+    "name","group_attendants_name","client_name",
+    "services_catalog_name","services_catalog_area_name",
+    "services_catalog_item_name","ticket_title","duration",
+    "waiting_time","responsible","rating","created_at"
+]
+
+_HMS_RE = r'^\s*([+-]?[0-9]+)\s*(?::\s*([+-]?[0-9]+)\s*)?(?::\s*([+-]?[0-9]+)\s*)?$'
+
+def _sem_tz(serie: pd.Series) -> pd.Series:
+    try:
+        if pd.api.types.is_datetime64tz_dtype(serie):
+            return serie.dt.tz_convert(None)
+    except Exception:
+        try:
+            return serie.dt.tz_localize(None)
+        except Exception:
+            pass
+    return serie
+
+def _preparar_base(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = df.columns.str.strip()
+    return df.dropna(how="all")
+
+def _processar_df_base_legado(df: pd.DataFrame) -> pd.DataFrame:
+    df = _preparar_base(df)
+    colunas_necessarias = COLUNAS_NECESSARIAS
+    df = df[df.apply(lambda row: linha_valida_em_colunas(row, colunas_necessarias), axis=1)]
+    df = df[[c for c in colunas_necessarias if c in df.columns]]
+
+    if "waiting_time" in df.columns:
+        df["tempo_espera_segundos"] = df["waiting_time"].apply(converter_para_segundos)
+    if "duration" in df.columns:
+        df["duracao_minutos"] = df["duration"].apply(converter_para_minutos)
+    if "rating" in df.columns:
+        df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+    if "created_at" in df.columns:
+        df["turno"] = df["created_at"].apply(definir_turno)
+        df["created_dt"] = pd.to_datetime(df["created_at"], errors="coerce")
+    else:
+        df["created_dt"] = pd.NaT
+    df["created_dt"] = _sem_tz(df["created_dt"])
+    return df
+
+# ---------------- Versões colunares (mesma semântica do legado) ----------------
+def _hms_partes(serie: pd.Series) -> pd.DataFrame:
+    # "ss", "mm:ss" ou "hh:mm:ss" -> colunas h/m/s; o que não casar vira NaN
+    txt = serie.astype(str).where(serie.notna())
+    partes = txt.str.extract(_HMS_RE).apply(pd.to_numeric, errors="coerce").astype("float64")
+    n = partes.notna().sum(axis=1)
+    p1, p2, p3 = partes[0], partes[1], partes[2]
+    h = p1.where(n == 3, 0)
+    m = p2.where(n == 3, p1.where(n == 2, 0))
+    sec = p3.where(n == 3, p2.where(n == 2, p1))
+    return pd.DataFrame({"h": h, "m": m, "s": sec}).where(n > 0)
+
+def segundos_vetorizado(serie: pd.Series) -> pd.Series:
+    p = _hms_partes(serie)
+    return (p["h"]*3600 + p["m"]*60 + p["s"]).astype("float64")
+
+def minutos_vetorizado(serie: pd.Series) -> pd.Series:
+    p = _hms_partes(serie)
+    return (p["h"]*60 + p["m"] + p["s"]/60).astype("float64")
+
+def turno_por_hora(hora: pd.Series) -> pd.Series:
+    turno = pd.cut(hora, bins=[-1, 6, 12, 17, 22, 23],
+                   labels=["Madrugada","Manhã","Tarde","Noite","Madrugada"], ordered=False)
+    return turno.astype(object).where(hora.notna(), "Outro").astype(str)
+
+def _processar_df_base_vetorizado(df: pd.DataFrame) -> pd.DataFrame:
+    df = _preparar_base(df)
+    presentes = [c for c in COLUNAS_NECESSARIAS if c in df.columns]
+    # equivalente a linha_valida_em_colunas: qualquer célula não nula valida a linha
+    df = df.loc[df[presentes].notna().any(axis=1), presentes].copy()
+
+    if "waiting_time" in df.columns:
+        df["tempo_espera_segundos"] = segundos_vetorizado(df["waiting_time"])
+    if "duration" in df.columns:
+        df["duracao_minutos"] = minutos_vetorizado(df["duration"])
+    if "rating" in df.columns:
+        df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+    if "created_at" in df.columns:
+        dt = pd.to_datetime(df["created_at"], errors="coerce")  # parse único
+        if pd.api.types.is_datetime64_any_dtype(dt):
+            turno = turno_por_hora(dt.dt.hour)
+            # linhas que o parse em coluna não entendeu: cai no parse por linha (raras)
+            resto = dt.isna() & df["created_at"].notna()
+            if resto.any():
+                turno.loc[resto] = df.loc[resto, "created_at"].apply(definir_turno)
+        else:
+            turno = df["created_at"].apply(definir_turno)
+        df["turno"] = turno
+        df["created_dt"] = dt
+    else:
+        df["created_dt"] = pd.NaT
+    df["created_dt"] = _sem_tz(df["created_dt"])
+    return df
+
+def comparar_processamentos(df: pd.DataFrame) -> Tuple[dict, pd.DataFrame]:
+    t0 = time.perf_counter(); leg = _processar_df_base_legado(df)
+    t1 = time.perf_counter(); vet = _processar_df_base_vetorizado(df)
+    t2 = time.perf_counter()
+    rel = {"linhas": len(vet), "legado_s": round(t1 - t0, 4), "vetorizado_s": round(t2 - t1, 4),
+           "iguais": True, "diferenca": ""}
+    try:
+        pd.testing.assert_frame_equal(leg, vet, check_dtype=False)
+    except AssertionError as e:
+        rel["iguais"] = False; rel["diferenca"] = str(e)[:500]
+    return rel, vet
+
+def processar_df_base(df: pd.DataFrame, modo: Optional[str] = None) -> pd.DataFrame:
+    modo = (modo or INGESTAO_MODO)
+    with etapa("processar_df_base") as sp:
+        sp["linhas"] = len(df)
+        if modo == "legado":
+            return _processar_df_base_legado(df)
+        if modo == "comparar":
+            rel, out = comparar_processamentos(df)
+            out.attrs["_ingestao_comparacao_"] = rel
+            return out
+        return _processar_df_base_vetorizado(df)
+
+# ------------- Download em streaming + processamento por blocos -------------
+# Acima de STREAMING_MIN_BYTES (ou sem Content-Length) o corpo não é mantido inteiro
+# em memória: é lido por blocos, cada bloco passa por processar_df_base e no fim concatena.
+STREAMING_MIN_BYTES = int(os.getenv("STREAMING_MIN_BYTES", str(8 * 1024 * 1024)))
+STREAMING_CHUNK_LINHAS = 100_000
+
+class _StreamHTTP(io.RawIOBase):
+    def __init__(self, prefixo: bytes, blocos):
+        self._buf, self._pos, self._blocos = prefixo, 0, blocos
+        self.lidos, self.tempo_rede = 0, 0.0  # tempo_rede: espera pelos blocos do socket
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._buf):
+            t0 = time.perf_counter()
+            try: self._buf, self._pos = next(self._blocos), 0
+            except StopIteration: return 0
+            finally: self.tempo_rede += time.perf_counter() - t0
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n; self.lidos += n
+        return n
+
+# ------------- Ingestão incremental (hash por linha + marca d'água em created_dt) -------------
+# Cada linha bruta ganha uma chave (hash do conteúdo + nº da ocorrência). No refresh,
+# linhas com chave já conhecida são reaproveitadas do histórico processado; só as
+# novas/alteradas passam por processar_df_base. Linhas que sumiram do arquivo saem.
+INGESTAO_INCREMENTAL = os.getenv("INGESTAO_INCREMENTAL", "1").strip().lower() not in ("0", "false", "nao", "não")
+
+def chaves_linhas(bruto: pd.DataFrame, vistos: Optional[pd.Series] = None) -> Tuple[pd.Series, pd.Series]:
+    base = bruto.copy(deep=False)
+    base.columns = base.columns.str.strip()
+    cols = [c for c in COLUNAS_NECESSARIAS if c in base.columns]
+    h = pd.util.hash_pandas_object(base[cols].astype(str), index=False)
+    h = h ^ int(hashlib.sha1("|".join(cols).encode()).hexdigest()[:15], 16)  # layout de colunas entra na chave
+    ocorr = h.groupby(h).cumcount().to_numpy()
+    if vistos is not None and len(vistos):
+        ocorr = ocorr + vistos.reindex(h.to_numpy()).fillna(0).astype("int64").to_numpy()
+    chaves = pd.util.hash_pandas_object(pd.DataFrame({"h": h.to_numpy(), "o": ocorr}), index=False)
+    chaves.index = bruto.index
+    cont = h.value_counts()
+    vistos = cont if vistos is None else vistos.add(cont, fill_value=0).astype("int64")
+    return chaves, vistos
+
+def posicoes_historico(historico: Optional[dict]) -> Optional[pd.Series]:
+    # chave → rótulo da linha no histórico; montado uma vez por carga (não por bloco do streaming)
+    hist_ch = historico.get("chaves") if historico else None
+    if (not INGESTAO_INCREMENTAL or INGESTAO_MODO == "comparar" or hist_ch is None
+            or historico.get("df") is None):
+        return None
+    pos_hist = pd.Series(hist_ch.index, index=hist_ch.to_numpy())
+    return pos_hist[~pos_hist.index.duplicated()]
+
+def processar_incremental(bruto: pd.DataFrame, historico: Optional[dict] = None,
+                          vistos: Optional[pd.Series] = None, pos_hist: Optional[pd.Series] = None):
+    chaves, vistos = chaves_linhas(bruto, vistos)
+    if pos_hist is None: pos_hist = posicoes_historico(historico)
+    if pos_hist is None:
+        df = processar_df_base(bruto)
+        return df, chaves.loc[df.index], vistos, {"novas": len(df), "reaproveitadas": 0}
+    hist_df = historico["df"]
+    conhecidas = chaves.isin(pos_hist.index).to_numpy()
+    reaprov = hist_df.loc[pos_hist.loc[chaves[conhecidas].to_numpy()].to_numpy()]
+    reaprov.index = bruto.index[conhecidas]
+    novas = processar_df_base(bruto.loc[~conhecidas]) if (~conhecidas).any() else None
+    if novas is None or novas.empty: df = reaprov
+    elif reaprov.empty: df = novas
+    else: df = pd.concat([reaprov, novas]).sort_index()
+    marca = historico.get("marca_dagua")
+    stats = {"novas": 0 if novas is None else len(novas), "reaproveitadas": len(reaprov)}
+    if novas is not None and marca is not None and "created_dt" in novas.columns:
+        stats["apos_marca_dagua"] = int((novas["created_dt"] > marca).sum())
+    return df, chaves.loc[df.index], vistos, stats
+
+def _somar_stats(a: dict, b: dict) -> dict:
+    return {k: a.get(k, 0) + b.get(k, 0) for k in set(a) | set(b)}
+
+def _finalizar_incremental(df: pd.DataFrame, chaves: pd.Series, stats: dict, historico: Optional[dict]) -> dict:
+    marca = df["created_dt"].max() if "created_dt" in df.columns and len(df) else None
+    if historico and historico.get("df") is not None:
+        stats["removidas"] = len(historico["df"]) - stats.get("reaproveitadas", 0)
+    return {"chaves": chaves, "marca_dagua": None if pd.isna(marca) else marca, "incremental": stats}
+
+def _processar_stream(resp, dialeto: Optional[dict], progresso=None, historico: Optional[dict] = None):
+    total = int(resp.headers.get("Content-Length") or 0)
+    blocos = resp.iter_content(chunk_size=1024 * 1024)
+    prefixo, t_ini = b"", time.perf_counter()
+    for bloco in blocos:
+        prefixo += bloco
+        if len(prefixo) >= AMOSTRA_DIALETO_BYTES: break
+    registrar_etapa("download", time.perf_counter() - t_ini)
+    opts = dialeto or detectar_dialeto(prefixo)
+    fonte = _StreamHTTP(prefixo, blocos)
+    partes, partes_ch, stats, vistos, linhas = [], [], {}, None, 0
+    pos_hist = posicoes_historico(historico)
+    t_ini, t_proc = time.perf_counter(), 0.0
+    with warnings.catch_warnings(record=True) as avisos:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        leitor = pd.read_csv(io.BufferedReader(fonte), sep=opts["sep"], engine="c",
+                             encoding=opts["encoding"], on_bad_lines="warn",
+                             chunksize=STREAMING_CHUNK_LINHAS)
+        for i, bloco in enumerate(leitor):
+            if i == 0 and bloco.shape[1] <= 1:
+                raise ValueError(f"Separador {opts['sep']!r} gerou uma única coluna.")
+            t0 = time.perf_counter()
+            parte, ch, vistos, st_parte = processar_incremental(bloco, historico, vistos, pos_hist)
+            t_proc += time.perf_counter() - t0
+            partes.append(parte); partes_ch.append(ch); stats = _somar_stats(stats, st_parte)
+            linhas += len(parte)
+            if progresso: progresso(min(fonte.lidos / total, 1.0) if total else None, linhas)
+    # leitura e rede se intercalam: o parse é o tempo do laço menos a espera do socket e o processamento
+    registrar_etapa("download", fonte.tempo_rede)
+    registrar_etapa("parse_csv", time.perf_counter() - t_ini - fonte.tempo_rede - t_proc, linhas)
+    if partes:
+        df, chaves = pd.concat(partes), pd.concat(partes_ch)
+    else:
+        df = processar_df_base(pd.DataFrame(columns=COLUNAS_NECESSARIAS))
+        chaves = pd.Series([], dtype="uint64")
+    df.attrs["_read_opts_"] = dict(opts)
+    df.attrs["_linhas_descartadas_"] = sum(str(a.message).count("Skipping line") for a in avisos
+                                           if issubclass(a.category, pd.errors.ParserWarning))
+    return df, chaves, stats
+
+def baixar_e_processar(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                       dialeto: Optional[dict] = None, progresso=None, streaming: bool = True,
+                       historico: Optional[dict] = None) -> Optional[dict]:
+    # None = 304 (nada mudou); senão o frame já processado + validadores/dialeto
+    if not streaming:
+        status, conteudo, etag_n, lm_n = baixar_csv_condicional(url, etag, last_modified)
+        if status == 304: return None
+        bruto = ler_csv_robusto(conteudo, dialeto)
+        df, chaves, _, stats = processar_incremental(bruto, historico)
+        info = dict(bruto.attrs)
+    else:
+        headers = {}
+        if etag: headers["If-None-Match"] = etag
+        if last_modified: headers["If-Modified-Since"] = last_modified
+        with requests.get(url, timeout=60, headers=headers, stream=True) as resp:
+            if resp.status_code == 304: return None
+            resp.raise_for_status()
+            etag_n, lm_n = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+            tamanho = int(resp.headers.get("Content-Length") or 0)
+            try:
+                if 0 < tamanho < STREAMING_MIN_BYTES:
+                    with etapa("download"): conteudo = resp.content
+                    bruto = ler_csv_robusto(conteudo, dialeto)
+                    df, chaves, _, stats = processar_incremental(bruto, historico)
+                else:
+                    df, chaves, stats = _processar_stream(resp, dialeto, progresso, historico)
+                    bruto = df
+            except Exception:
+                bruto = None
+        if bruto is None:  # stream já consumido pela metade: fecha a conexão e refaz com o caminho tradicional
+            return baixar_e_processar(url, etag, last_modified, None, streaming=False, historico=historico)
+        info = dict(bruto.attrs)
+    chaves = chaves.set_axis(range(len(df)))
+    with etapa("tipos_ordenacao"):
+        df, chaves = ordenar_por_data(otimizar_tipos(df).reset_index(drop=True), chaves)
+    return {"df": df, "etag": etag_n, "last_modified": lm_n,
+            "dialeto": info.get("_read_opts_", {}), "linhas_descartadas": info.get("_linhas_descartadas_"),
+            **_finalizar_incremental(df, chaves, stats, historico)}
+
+# ------------- Layout compacto de tipos (memória por sessão/servidor) -------------
+MANTER_COLUNAS_BRUTAS = os.getenv("MANTER_COLUNAS_BRUTAS", "0").strip().lower() in ("1", "true", "sim")
+COLUNAS_BRUTAS_PARSEADAS = {"duration": "duracao_minutos", "waiting_time": "tempo_espera_segundos",
+                            "created_at": "created_dt"}
+COLUNAS_FLOAT32 = ("rating", "tempo_espera_segundos")  # valores pequenos/inteiros: float32 é exato
+CATEGORIA_MAX_RAZAO = 0.5  # texto vira category se nº de valores distintos <= 50% das linhas
+
+def otimizar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    attrs = dict(df.attrs)
+    if not MANTER_COLUNAS_BRUTAS:
+        df = df.drop(columns=[b for b, d in COLUNAS_BRUTAS_PARSEADAS.items()
+                              if b in df.columns and d in df.columns])
+    novas = {}
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            if s.nunique(dropna=True) <= max(1, len(s) * CATEGORIA_MAX_RAZAO):
+                novas[c] = s.astype("category")
+        elif pd.api.types.is_integer_dtype(s):
+            novas[c] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s) and c in COLUNAS_FLOAT32:
+            novas[c] = s.astype("float32")
+    if novas:
+        df = df.assign(**novas)
+    df.attrs.update(attrs)
+    return df
+
+def relatorio_memoria(df: pd.DataFrame) -> pd.DataFrame:
+    uso = df.memory_usage(deep=True, index=True)
+    rel = pd.DataFrame({"dtype": [str(df[c].dtype) if c in df.columns else "index" for c in uso.index],
+                        "bytes": uso.to_numpy()}, index=uso.index.astype(str))
+    rel["MB"] = (rel["bytes"] / 1024**2).round(3)
+    rel = rel.sort_values("bytes", ascending=False)
+    rel.loc["TOTAL"] = ["", int(rel["bytes"].sum()), round(rel["bytes"].sum() / 1024**2, 3)]
+    return rel
+
+# ------------- Snapshot processado em disco (reinício a quente) -------------
+SNAPSHOT_DIR = "cache"
+SNAPSHOT_SCHEMA = 1  # muda quando o formato do arquivo/cabeçalho mudar
+
+def _versao_processamento() -> str:
+    # hash do código que gera as colunas derivadas: mudou o código, snapshot antigo é descartado
+    fontes = [_preparar_base, _processar_df_base_vetorizado, _hms_partes,
+              segundos_vetorizado, minutos_vetorizado, turno_por_hora, definir_turno, _sem_tz, otimizar_tipos]
+    h = hashlib.sha1(f"{SNAPSHOT_SCHEMA}|{COLUNAS_NECESSARIAS}|{MANTER_COLUNAS_BRUTAS}".encode())
+    for fn in fontes:
+        try: h.update(inspect.getsource(fn).encode("utf-8"))
+        except (OSError, TypeError): h.update(fn.__name__.encode())
+    return h.hexdigest()[:16]
+
+def _snapshot_path(url: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"dataset_{hashlib.sha1(url.encode()).hexdigest()[:16]}.parquet")
+
+def salvar_snapshot(url: str, df: pd.DataFrame, etag: Optional[str], last_modified: Optional[str],
+                    dialeto: Optional[dict] = None, chaves: Optional[pd.Series] = None,
+                    marca_dagua=None) -> bool:
+    try:
+        import pyarrow as pa, pyarrow.parquet as pq
+    except ImportError:
+        return False
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        meta = {"schema": SNAPSHOT_SCHEMA, "versao_processamento": _versao_processamento(),
+                "url": url, "etag": etag, "last_modified": last_modified, "dialeto": dialeto or {},
+                "marca_dagua": None if marca_dagua is None else str(marca_dagua),
+                "gerado_em": datetime.now().isoformat(timespec="seconds")}
+        if chaves is not None and len(chaves) == len(df):
+            df = df.assign(__chave__=chaves.to_numpy())  # cópia rasa; o df em cache não muda
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               b"novetech_snapshot": json.dumps(meta).encode("utf-8")})
+        path = _snapshot_path(url)
+        fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".parquet"); os.close(fd)
+        try:
+            pq.write_table(table, tmp)
+            os.replace(tmp, path); tmp = None
+        finally:
+            if tmp and os.path.exists(tmp): os.remove(tmp)  # escrita falhou: não deixa .parquet órfão
+        return True
+    except Exception:
+        return False
+
+def carregar_snapshot(url: str) -> Optional[dict]:
+    path = _snapshot_path(url)
+    if not os.path.exists(path): return None
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    with etapa("snapshot"):
+        return _ler_snapshot(url, path, pq)
+
+def _ler_snapshot(url: str, path: str, pq) -> Optional[dict]:
+    try:
+        meta = json.loads((pq.read_schema(path).metadata or {}).get(b"novetech_snapshot", b"{}"))
+        if (meta.get("schema") != SNAPSHOT_SCHEMA or meta.get("url") != url
+                or meta.get("versao_processamento") != _versao_processamento()):
+            os.remove(path)  # cabeçalho de outra versão: descarta
+            return None
+        df = pq.read_table(path).to_pandas()
+        chaves = df.pop("__chave__") if "__chave__" in df.columns else None
+        df = marcar_se_ordenado(df)
+        marca = meta.get("marca_dagua")
+        return {"df": df, "etag": meta.get("etag"), "last_modified": meta.get("last_modified"),
+                "dialeto": meta.get("dialeto") or {}, "chaves": chaves,
+                "marca_dagua": pd.Timestamp(marca) if marca else None}
+    except Exception:
+        return None
+
+# ------------- Cubo diário de KPIs (pré-agregado na ingestão) -------------
+# Por dia (e por dia × dimensão) guarda n, contagem, soma e soma dos quadrados das
+# métricas; qualquer período sai somando algumas centenas de linhas do cubo.
+METRICAS_CUBO = ("rating", "duracao_minutos", "tempo_espera_segundos")
+DIMENSOES_CUBO = ("responsible", "client_name", "services_catalog_name",
+                  "services_catalog_item_name", "turno", "group_attendants_name")
+
+def rotulo_responsavel(s: pd.Series) -> pd.Series:
+    # rótulo único de cubo e sketches: sem espaços nas pontas, vazio = ausente
+    return s.astype("string").str.strip().replace("", pd.NA)
+
+def _dia_de(df: pd.DataFrame) -> pd.Series:
+    if "created_dt" in df.columns and pd.api.types.is_datetime64_dtype(df["created_dt"]):
+        return df["created_dt"].dt.normalize()
+    return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+
+def construir_cubo(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    with etapa("cubo") as sp:
+        sp["linhas"] = len(df)
+        return _construir_cubo(df)
+
+def _construir_cubo(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    base = pd.DataFrame({"dia": _dia_de(df).to_numpy()})
+    aggs = {"n": ("dia", "size")}
+    for m in METRICAS_CUBO:
+        if m not in df.columns: continue
+        v = df[m].astype("float64").to_numpy()
+        base[m] = v; base[f"{m}__2"] = v * v
+        aggs[f"{m}_n"] = (m, "count"); aggs[f"{m}_soma"] = (m, "sum"); aggs[f"{m}_soma2"] = (f"{m}__2", "sum")
+    cubo = {"_total": base.groupby("dia", dropna=False).agg(**aggs).reset_index()}
+    for d in DIMENSOES_CUBO:
+        if d not in df.columns: continue
+        valor = rotulo_responsavel(df[d]) if d == "responsible" else df[d]
+        g = (base.assign(valor=valor.to_numpy())
+             .groupby(["dia", "valor"], dropna=False, observed=True).agg(**aggs).reset_index())
+        cubo[d] = g[g["valor"].notna()].reset_index(drop=True)
+    return cubo
+
+def _fatia_cubo(tab: pd.DataFrame, start_date: Optional[date], end_date: Optional[date]) -> pd.DataFrame:
+    # sem período: tudo (inclusive linhas sem data), como no df sem filtro
+    if start_date is None or end_date is None: return tab
+    return tab[(tab["dia"] >= pd.Timestamp(start_date)) & (tab["dia"] <= pd.Timestamp(end_date))]
+
+def resumo_cubo(cubo: Dict[str, pd.DataFrame], nome: str = "_total",
+                start_date: Optional[date] = None, end_date: Optional[date] = None) -> Optional[pd.DataFrame]:
+    tab = cubo.get(nome)
+    if tab is None: return None
+    f = _fatia_cubo(tab, start_date, end_date).drop(columns="dia")
+    if nome == "_total":
+        res = f.sum(numeric_only=True).to_frame().T
+    else:
+        res = f.groupby("valor", observed=True).sum(numeric_only=True)
+        res = res[res["n"] > 0]
+    for m in METRICAS_CUBO:
+        if f"{m}_n" in res.columns:
+            n = res[f"{m}_n"].where(res[f"{m}_n"] > 0)
+            res[f"{m}_media"] = res[f"{m}_soma"] / n
+    return res
+
+def contagens_cubo(cubo: Dict[str, pd.DataFrame], dim: str,
+                   start_date: Optional[date] = None, end_date: Optional[date] = None) -> Optional[pd.Series]:
+    # equivalente a df_f[dim].value_counts()
+    res = resumo_cubo(cubo, dim, start_date, end_date)
+    if res is None: return None
+    vc = res["n"].astype("int64").sort_values(ascending=False, kind="stable")
+    vc.index = vc.index.astype(object); vc.index.name = dim
+    return vc.rename("count")
+
+# ------------- Sketches de quantis por dia × responsável (mescláveis) -------------
+# Histograma em escala log no estilo DDSketch: o bucket i cobre (γ^(i-1), γ^i] e o valor
+# devolvido tem erro relativo <= SKETCH_ALFA. Mesclar dias = somar contagens por bucket,
+# então p50/p90/p95 de qualquer período saem sem reordenar as linhas brutas.
+SKETCH_ALFA = 0.01
+SKETCH_METRICAS = ("duracao_minutos", "tempo_espera_segundos")
+QUANTIS_KPI = (0.5, 0.9, 0.95)
+_SKETCH_LOG_GAMA = float(np.log((1 + SKETCH_ALFA) / (1 - SKETCH_ALFA)))
+_SKETCH_MIN = 1e-3  # valores <= isso (zero e negativos inclusive) caem no bucket zero
+_SKETCH_ZERO = np.iinfo(np.int16).min
+
+def construir_sketches(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    with etapa("sketches") as sp:
+        sp["linhas"] = len(df)
+        return _construir_sketches(df)
+
+def _construir_sketches(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    # {métrica: DataFrame(dia, responsible, bucket, n)}
+    sk = {}
+    dia = _dia_de(df).to_numpy()
+    resp = (rotulo_responsavel(df["responsible"]).to_numpy() if "responsible" in df.columns
+            else np.full(len(df), None, dtype=object))
+    for m in SKETCH_METRICAS:
+        if m not in df.columns: continue
+        v = df[m].astype("float64").to_numpy()
+        ok = ~np.isnan(v); pos = ok & (v > _SKETCH_MIN)
+        bucket = np.full(len(v), _SKETCH_ZERO, dtype="int16")
+        bucket[pos] = np.ceil(np.log(v[pos]) / _SKETCH_LOG_GAMA)
+        base = pd.DataFrame({"dia": dia[ok], "responsible": resp[ok], "bucket": bucket[ok]})
+        g = base.groupby(["dia", "responsible", "bucket"], dropna=False, sort=True).size().rename("n").reset_index()
+        sk[m] = g.astype({"responsible": "category", "n": "int32"})
+    return sk
+
+def _valor_bucket(bucket: np.ndarray) -> np.ndarray:
+    gama = np.exp(_SKETCH_LOG_GAMA)
+    return np.where(bucket == _SKETCH_ZERO, 0.0, 2 * np.exp(bucket.astype("float64") * _SKETCH_LOG_GAMA) / (1 + gama))
+
+def _histograma_sketch(sk: Dict[str, pd.DataFrame], metrica: str, start_date: Optional[date],
+                       end_date: Optional[date], por_responsavel: bool) -> Optional[pd.DataFrame]:
+    tab = sk.get(metrica)
+    if tab is None: return None
+    f = _fatia_cubo(tab, start_date, end_date)
+    if por_responsavel:
+        h = f.groupby(["responsible", "bucket"], observed=True, sort=True)["n"].sum().reset_index()
+        h = h.rename(columns={"responsible": "_g"})
+    else:
+        h = f.groupby("bucket", sort=True)["n"].sum().reset_index().assign(_g="_total")
+    h = h[h["n"] > 0].reset_index(drop=True)
+    h["acum"] = h.groupby("_g")["n"].cumsum(); h["tot"] = h.groupby("_g")["n"].transform("sum")
+    h["valor"] = _valor_bucket(h["bucket"].to_numpy())
+    return h
+
+def quantis_sketch(sk: Dict[str, pd.DataFrame], metrica: str, quantis=QUANTIS_KPI,
+                   start_date: Optional[date] = None, end_date: Optional[date] = None,
+                   por_responsavel: bool = False, limite: Optional[float] = None) -> Optional[pd.DataFrame]:
+    # uma linha por responsável (ou "_total"): n, p50/p90/…, e % <= limite (SLA) se pedido
+    h = _histograma_sketch(sk, metrica, start_date, end_date, por_responsavel)
+    if h is None: return None
+    res = h.groupby("_g")["tot"].first().rename("n").to_frame()
+    for q in quantis:
+        # primeiro bucket cujo acumulado passa do posto q·(n-1)
+        acima = h[h["acum"] > q * (h["tot"] - 1)]
+        res[f"p{round(q * 100)}"] = acima.groupby("_g")["valor"].first()
+    if limite is not None:
+        res["pct_ate_limite"] = h[h["valor"] <= limite].groupby("_g")["n"].sum().reindex(res.index, fill_value=0) / res["n"]
+    res.index.name = "responsible" if por_responsavel else None
+    return res
+
+# ------------- Séries diárias/semanais (tendências) a partir do cubo e dos sketches -------------
+# Calendário completo (dias sem chat = 0), janelas móveis por soma de contagens/somas e
+# média = soma/contagem: nada roda por linha, e dois anos são ~730 linhas.
+def _calendario(idx: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    return pd.date_range(idx.min(), idx.max(), freq="D")
+
+def _semana_iso(idx: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    return idx - pd.to_timedelta(idx.weekday, unit="D")  # segunda-feira da semana ISO
+
+def _fatia_serie(d: pd.DataFrame, start_date: Optional[date], end_date: Optional[date], semanal: bool) -> pd.DataFrame:
+    if start_date is None or end_date is None: return d
+    ini = pd.Timestamp(start_date) - (pd.Timedelta(days=6) if semanal else pd.Timedelta(0))
+    return d[(d.index >= ini) & (d.index <= pd.Timestamp(end_date))]
+
+def serie_cubo(cubo: Dict[str, pd.DataFrame], dim: str = "_total", valor=None,
+               start_date: Optional[date] = None, end_date: Optional[date] = None,
+               semanal: bool = False, janela: Optional[int] = None) -> Optional[pd.DataFrame]:
+    # n e médias por dia (ou semana ISO); janela = nº de dias/semanas da soma móvel
+    tab = cubo.get(dim)
+    if tab is None: return None
+    if valor is not None: tab = tab[tab["valor"] == valor]
+    tab = tab[tab["dia"].notna()]
+    cols = ["n"] + [c for c in tab.columns if c.endswith(("_n", "_soma"))]
+    d = tab.groupby("dia")[cols].sum()
+    if d.empty: return d
+    d = d.reindex(_calendario(d.index), fill_value=0)
+    if semanal: d = d.groupby(_semana_iso(d.index)).sum()
+    if janela: d = d.rolling(janela, min_periods=1).sum()  # antes do corte: início do período já tem histórico
+    d = _fatia_serie(d, start_date, end_date, semanal).copy()
+    for m in METRICAS_CUBO:
+        if f"{m}_n" in d.columns: d[f"{m}_media"] = d[f"{m}_soma"] / d[f"{m}_n"].where(d[f"{m}_n"] > 0)
+    return d
+
+def serie_quantis_sketch(sk: Dict[str, pd.DataFrame], metrica: str, quantis=QUANTIS_KPI, responsavel=None,
+                         start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         semanal: bool = False, janela: Optional[int] = None) -> Optional[pd.DataFrame]:
+    # matriz dia × bucket; janela móvel = diferença de somas acumuladas; quantil por linha
+    tab = sk.get(metrica)
+    if tab is None: return None
+    if responsavel is not None: tab = tab[tab["responsible"] == responsavel]
+    tab = tab[tab["dia"].notna()]
+    if tab.empty: return None
+    m = tab.groupby(["dia", "bucket"])["n"].sum().unstack(fill_value=0).sort_index(axis=1)
+    m = m.reindex(_calendario(m.index), fill_value=0)
+    if semanal: m = m.groupby(_semana_iso(m.index)).sum()
+    mat = m.to_numpy(dtype="float64")
+    if janela:
+        acum = mat.cumsum(axis=0); antes = np.zeros_like(acum)
+        antes[janela:] = acum[:-janela]; mat = acum - antes
+    acum = mat.cumsum(axis=1); tot = acum[:, -1]
+    valores = _valor_bucket(m.columns.to_numpy())
+    res = pd.DataFrame(index=m.index)
+    for q in quantis:
+        pos = (acum > (q * (tot - 1))[:, None]).argmax(axis=1)
+        res[f"p{round(q * 100)}"] = np.where(tot > 0, valores[pos], np.nan)
+    return _fatia_serie(res, start_date, end_date, semanal)
+
+# ------------- Entrada de dataset (snapshot + download condicional) -------------
+def entrada_do_snapshot(url: str) -> Optional[dict]:
+    snap = carregar_snapshot(url)
+    if not snap: return None
+    return {**snap, "checado_em": 0.0, "cubo": construir_cubo(snap["df"]),
+            "sketches": construir_sketches(snap["df"]),
+            "versao": f"{snap['etag'] or snap['last_modified'] or ''}|snapshot"}
+
+def atualizar_entrada(url: str, ent: Optional[dict] = None, dialeto: Optional[dict] = None,
+                      progresso=None, agora: Optional[float] = None) -> dict:
+    # revalida ent (304) ou devolve uma entrada nova, já com cubo/sketches e snapshot salvo
+    agora = time.time() if agora is None else agora
+    novo = baixar_e_processar(url, ent["etag"] if ent else None, ent["last_modified"] if ent else None,
+                              dialeto, progresso=progresso, historico=ent)
+    if novo is None and ent:
+        ent["checado_em"] = agora
+        return ent
+    if novo is None:  # 304 sem nada em cache: baixa sem validadores
+        novo = baixar_e_processar(url, dialeto=dialeto, progresso=progresso)
+    ent = {**novo, "checado_em": agora, "cubo": construir_cubo(novo["df"]),
+           "sketches": construir_sketches(novo["df"]),
+           "versao": f"{novo['etag'] or novo['last_modified'] or ''}|{agora:.0f}"}
+    with etapa("snapshot"):
+        salvar_snapshot(url, ent["df"], ent["etag"], ent["last_modified"], ent["dialeto"],
+                        ent.get("chaves"), ent.get("marca_dagua"))
+    return ent
@@ -0,0 +1,178 @@
+# relatorio_lote.py — fechamento em lote, sem Streamlit: KPIs de todos os técnicos em
+# todos os meses (ou períodos escolhidos), calculados em paralelo e gravados num arquivo só.
+#
+#   python relatorio_lote.py --saida fechamento.xlsx                       # todos os meses do CSV
+#   python relatorio_lote.py --de 2024-01-01 --ate 2024-06-30 --saida s1.parquet
+#   python relatorio_lote.py --periodo 2024-01-01:2024-01-15 --periodo 2024-01-16:2024-01-31 --saida q.csv
+#   python relatorio_lote.py --arquivo chats_resume.csv --saida fechamento.csv   # CSV local em vez do link
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from nucleo import (
+    DEFAULT_CSV_URL, META_POR_METRICA, SKETCH_METRICAS, load_users, load_fichas,
+    ler_csv_robusto, processar_df_base, otimizar_tipos, ordenar_por_data, faixa_datas, filter_df_by_period,
+    compute_kpis_por_responsavel, kpi_do_tecnico, construir_sketches, quantis_sketch,
+    entrada_do_snapshot, atualizar_entrada,
+)
+
+ROTULO_METRICA = {"duracao_minutos": "tma_min", "tempo_espera_segundos": "tme_s"}
+
+# ---------------- Base (carregada uma vez; cada processo recebe uma cópia no initializer) ----------------
+_BASE: dict = {}
+
+def _iniciar_worker(df: pd.DataFrame, sketches: Dict[str, pd.DataFrame]):
+    _BASE["df"], _BASE["sketches"] = df, sketches
+
+def carregar_base(url: str, arquivo: Optional[str] = None) -> pd.DataFrame:
+    if arquivo:
+        with open(arquivo, "rb") as f: bruto = ler_csv_robusto(f.read())
+        df, _ = ordenar_por_data(otimizar_tipos(processar_df_base(bruto)).reset_index(drop=True))
+        return df
+    ent = entrada_do_snapshot(url)  # mesmo snapshot/validação condicional do app
+    try:
+        ent = atualizar_entrada(url, ent)
+    except Exception as e:
+        if not ent: raise
+        print(f"aviso: link indisponível, usando o snapshot local ({e})", file=sys.stderr)
+    return ent["df"]
+
+# ---------------- Períodos ----------------
+def _data(txt: str) -> date:
+    return datetime.strptime(txt.strip(), "%Y-%m-%d").date()
+
+def periodos_mensais(df: pd.DataFrame, de: Optional[date] = None, ate: Optional[date] = None) -> List[Tuple[str, date, date]]:
+    ini, fim = faixa_datas(df)
+    if ini is None: return []
+    ini, fim = max(ini.date(), de) if de else ini.date(), min(fim.date(), ate) if ate else fim.date()
+    if ini > fim: return []
+    return [(str(m), m.start_time.date(), m.end_time.date()) for m in pd.period_range(ini, fim, freq="M")]
+
+def periodos_informados(valores: List[str]) -> List[Tuple[str, date, date]]:
+    res = []
+    for v in valores:
+        a, _, b = v.partition(":")
+        ini, fim = _data(a), _data(b or a)
+        if ini > fim: raise ValueError(f"período invertido: {v}")
+        res.append((f"{ini:%Y-%m-%d} a {fim:%Y-%m-%d}", ini, fim))
+    return res
+
+# ---------------- Cálculo por período (roda nos processos do pool) ----------------
+def _ultima_ficha(fichas: List[dict], fim: date) -> Optional[dict]:
+    # fichas vêm da mais recente para a mais antiga; vale a última salva até o fim do período
+    for f in fichas:
+        try:
+            if datetime.strptime(f.get("data", ""), "%d/%m/%Y %H:%M").date() <= fim: return f
+        except ValueError:
+            continue
+    return None
+
+def kpis_do_periodo(rotulo: str, ini: date, fim: date, tecnicos: List[dict], fichas: Dict[str, List[dict]],
+                    alias_map: Optional[dict] = None, incluir_nao_vinculados: bool = False) -> List[dict]:
+    df_f = filter_df_by_period(_BASE["df"], ini, fim)
+    kpis_norm, labels = compute_kpis_por_responsavel(df_f)
+    pcts = {m: quantis_sketch(_BASE["sketches"], m, start_date=ini, end_date=fim, por_responsavel=True,
+                              limite=META_POR_METRICA[m]) for m in SKETCH_METRICAS if m in _BASE["sketches"]}
+
+    def _linha(tecnico: Optional[dict], kpi: Optional[dict]) -> dict:
+        label = kpi["responsavel_label"] if kpi else None
+        linha = {"periodo": rotulo, "inicio": ini, "fim": fim,
+                 "tecnico": tecnico["name"] if tecnico else None, "usuario": tecnico["username"] if tecnico else None,
+                 "responsavel_csv": label, "atendimentos": kpi["qtd"] if kpi else 0,
+                 "media_avaliacao": kpi["rating_media"] if kpi else None,
+                 "media_duracao_min": kpi["duracao_media"] if kpi else None,
+                 "media_espera_s": kpi["espera_media"] if kpi else None}
+        for m, q in pcts.items():
+            r = q.loc[label] if q is not None and label in q.index else None
+            for p in ("p50", "p90", "p95"):
+                linha[f"{ROTULO_METRICA[m]}_{p}"] = r[p] if r is not None else None
+            linha[f"{ROTULO_METRICA[m]}_pct_na_meta"] = r["pct_ate_limite"] if r is not None else None
+        ficha = _ultima_ficha(fichas.get(tecnico["username"], []), fim) if tecnico else None
+        linha.update({"ficha_data": ficha.get("data") if ficha else None,
+                      "ficha_nota_final": ficha.get("nota_final") if ficha else None,
+                      "ficha_conceito": ficha.get("conceito") if ficha else None})
+        return linha
+
+    linhas, vinculados = [], set()
+    for t in tecnicos:
+        _, kpi = kpi_do_tecnico(t, kpis_norm, alias_map)
+        if kpi: vinculados.add(kpi["responsavel_label"])
+        linhas.append(_linha(t, kpi))
+    if incluir_nao_vinculados:
+        por_label = {k["responsavel_label"]: k for k in kpis_norm.values()}
+        linhas += [_linha(None, por_label[l]) for l in labels if l not in vinculados]
+    return linhas
+
+# ---------------- Saída ----------------
+FORMATOS_SAIDA = (".csv", ".parquet", ".xlsx")
+
+def _saida(caminho: str) -> str:
+    # validado no parse: evita carregar e calcular tudo para falhar só na gravação
+    if os.path.splitext(caminho)[1].lower() not in FORMATOS_SAIDA:
+        raise argparse.ArgumentTypeError(f"formato não suportado: {caminho} (use .csv, .parquet ou .xlsx)")
+    return caminho
+
+def salvar_relatorio(rel: pd.DataFrame, caminho: str):
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == ".parquet":
+        rel.to_parquet(caminho, index=False)
+    elif ext == ".xlsx":
+        with pd.ExcelWriter(caminho) as w: rel.to_excel(w, sheet_name="kpis", index=False)
+    elif ext == ".csv":
+        rel.to_csv(caminho, index=False, encoding="utf-8")
+    else:
+        raise ValueError(f"formato não suportado: {ext or caminho} (use .csv, .parquet ou .xlsx)")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Relatório consolidado de KPIs por técnico e período (sem Streamlit).")
+    fonte = ap.add_mutually_exclusive_group()
+    fonte.add_argument("--url", default=DEFAULT_CSV_URL, help="link do chats_resume (padrão: link salvo do app)")
+    fonte.add_argument("--arquivo", help="CSV local em vez do link")
+    ap.add_argument("--periodo", action="append", default=[], metavar="INI:FIM",
+                    help="período AAAA-MM-DD:AAAA-MM-DD (repetível); sem ele, um período por mês")
+    ap.add_argument("--de", type=_data, help="primeiro dia considerado nos períodos mensais")
+    ap.add_argument("--ate", type=_data, help="último dia considerado nos períodos mensais")
+    ap.add_argument("--saida", required=True, type=_saida, help="arquivo de saída (.csv, .parquet ou .xlsx)")
+    ap.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="tamanho do pool (1 = sem pool)")
+    ap.add_argument("--incluir-nao-vinculados", action="store_true",
+                    help="acrescenta responsáveis do CSV que não casam com nenhum técnico")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    df = carregar_base(args.url, args.arquivo)
+    sketches = construir_sketches(df)
+    periodos = periodos_informados(args.periodo) if args.periodo else periodos_mensais(df, args.de, args.ate)
+    if not periodos:
+        print("nenhum período com dados", file=sys.stderr); return 1
+    tecnicos = [u for u in load_users(avisar=lambda m: print(f"aviso: {m}", file=sys.stderr)) if u.get("role") == "tecnico"]
+    fichas = load_fichas()
+    fichas = {t["username"]: fichas.get(t["username"], []) for t in tecnicos}  # só o necessário vai para os processos
+    print(f"{len(df)} chats, {len(tecnicos)} técnicos, {len(periodos)} períodos "
+          f"(carga {time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    linhas = []
+    extra = (tecnicos, fichas, None, args.incluir_nao_vinculados)
+    if args.processos <= 1 or len(periodos) == 1:
+        _iniciar_worker(df, sketches)
+        for p in periodos: linhas += kpis_do_periodo(*p, *extra)
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.processos, len(periodos)),
+                                 initializer=_iniciar_worker, initargs=(df, sketches)) as pool:
+            futuros = {pool.submit(kpis_do_periodo, *p, *extra): p[0] for p in periodos}
+            for fut in as_completed(futuros):
+                linhas += fut.result()
+                print(f"  {futuros[fut]} ok", file=sys.stderr)
+
+    rel = pd.DataFrame(linhas).sort_values(["inicio", "tecnico", "responsavel_csv"], na_position="last", kind="stable")
+    salvar_relatorio(rel, args.saida)
+    print(f"{len(rel)} linhas em {args.saida} ({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())